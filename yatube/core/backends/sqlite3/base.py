@@ -0,0 +1,21 @@
+"""
+SQLite, в котором транзакции могут сразу брать блокировку записи.
+
+Обычный BEGIN в режиме WAL откладывает блокировку до первой записи. Если
+к этому моменту другой процесс уже что-то зафиксировал, SQLite сразу
+отвечает «database is locked», и busy_timeout не помогает. Так падают
+atomic-вьюхи, которые сначала читают, а потом пишут. С TRANSACTION_MODE
+'IMMEDIATE' в описании базы блок atomic начинается с BEGIN IMMEDIATE и
+ждёт писателя в busy_timeout, а не падает.
+"""
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict.get('TRANSACTION_MODE', 'DEFERRED')
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f'Недопустимый TRANSACTION_MODE: {mode}')
+        self.cursor().execute(f'BEGIN {mode}')
@@ -0,0 +1,335 @@
+"""
+Кеш, общий для всех процессов на одном хосте.
+
+Данные лежат в файле SQLite (режим WAL), поэтому все WSGI-воркеры видят
+одни и те же записи без внешних сервисов. Перед SQLite стоит небольшой
+LRU внутри процесса (L1). Каждый ключ попадает в один из слотов файла
+поколений, отображённого в память через mmap: запись в любом процессе
+меняет метку слота, и чужие L1 перестают доверять своей копии, не делая
+ни одного системного вызова на проверку.
+"""
+import mmap
+import os
+import pickle
+import random
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+STAMP = struct.Struct('<Q')
+CHUNK_SIZE = 500
+CULL_EVERY = 256
+
+_l1_caches = {}
+_stamp_files = {}
+_registry_lock = threading.Lock()
+
+
+class StampFile:
+    """Метки поколений в файле, отображённом в память всех процессов."""
+
+    def __init__(self, path, slots):
+        self.slots = slots
+        size = slots * STAMP.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def _offset(self, key):
+        return zlib.crc32(key.encode()) % self.slots * STAMP.size
+
+    def read(self, key):
+        return STAMP.unpack_from(self._map, self._offset(key))[0]
+
+    def bump(self, key):
+        stamp = random.getrandbits(64)
+        STAMP.pack_into(self._map, self._offset(key), stamp)
+        return stamp
+
+    def bump_all(self):
+        self._map[:] = os.urandom(len(self._map))
+
+
+class L1Cache:
+    """Ограниченный LRU с pickled-значениями, общий для потоков процесса."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            pickled, expires, entry_stamp = entry
+            if entry_stamp != stamp or (
+                    expires is not None and expires <= time.time()):
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return pickled
+
+    def set(self, key, pickled, expires, stamp):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._data[key] = (pickled, expires, stamp)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT: писатель сразу берёт блокировку."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _registry_lock:
+            if location not in _stamp_files:
+                _stamp_files[location] = StampFile(
+                    f'{location}-stamps', options.get('STAMP_SLOTS', 4096)
+                )
+                _l1_caches[location] = L1Cache(
+                    options.get('L1_MAX_ENTRIES', 1000)
+                )
+        self._stamps = _stamp_files[location]
+        self._l1 = _l1_caches[location]
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._connection = None
+        self._pid = None
+        self._writes = 0
+
+    @property
+    def _db(self):
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL'
+                ') WITHOUT ROWID'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        """Значения ключей из L1, а промахи — из SQLite, пачками."""
+        found = {}
+        misses = {}
+        for key in keys:
+            stamp = self._stamps.read(key)
+            pickled = self._l1.get(key, stamp)
+            if pickled is None:
+                misses[key] = stamp
+            else:
+                found[key] = pickled
+        missing = list(misses)
+        now = time.time()
+        for start in range(0, len(missing), CHUNK_SIZE):
+            chunk = missing[start:start + CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self._db.execute(
+                'SELECT key, value, expires FROM cache '
+                f'WHERE key IN ({placeholders})',
+                chunk,
+            )
+            for key, pickled, expires in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[key] = pickled
+                self._l1.set(key, pickled, expires, misses[key])
+        return found
+
+    def _write(self, rows):
+        """Записывает (key, pickled, expires) и помечает слоты изменёнными."""
+        with self._transaction() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                rows,
+            )
+        for key, pickled, expires in rows:
+            self._l1.set(key, pickled, expires, self._stamps.bump(key))
+        self._maybe_cull(len(rows))
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    def _invalidate(self, keys):
+        for key in keys:
+            self._stamps.bump(key)
+            self._l1.delete(key)
+
+    def _maybe_cull(self, writes):
+        self._writes += writes
+        if self._writes < CULL_EVERY:
+            return
+        self._writes = 0
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > self._max_entries and self._cull_frequency:
+                db.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM cache ORDER BY expires IS NULL, expires '
+                    'LIMIT ?)',
+                    (count // self._cull_frequency,),
+                )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        expires = self._expires(timeout)
+        with self._transaction() as db:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, pickled, expires),
+            ).rowcount == 1
+        if added:
+            self._l1.set(key, pickled, expires, self._stamps.bump(key))
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        pickled = self._fetch([key]).get(key)
+        if pickled is None:
+            return default
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        self._write([(key, pickled, self._expires(timeout))])
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            touched = db.execute(
+                'UPDATE cache SET expires = ? '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self._expires(timeout), key, time.time()),
+            ).rowcount == 1
+        self._invalidate([key])
+        return touched
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        self._invalidate([key])
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            new_value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(new_value, self.pickle_protocol), key),
+            )
+        self._invalidate([key])
+        return new_value
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        return {
+            made[key]: pickle.loads(pickled)
+            for key, pickled in self._fetch(list(made)).items()
+        }
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        self._write([
+            (
+                self._key(key, version),
+                pickle.dumps(value, self.pickle_protocol),
+                expires,
+            )
+            for key, value in data.items()
+        ])
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as db:
+            db.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+        self._invalidate(keys)
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+        self._stamps.bump_all()
+        self._l1.clear()
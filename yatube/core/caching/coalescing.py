@@ -0,0 +1,64 @@
+"""
+Пересборка кеша без «эффекта толпы».
+
+Когда запись протухает, пересобирать её идёт один воркер: он берёт
+блокировку через cache.add, остальные в это время отдают устаревшую
+копию, а если копии нет — недолго ждут готовый результат. Кроме того,
+запись может быть пересобрана чуть раньше срока с вероятностью, которая
+растёт к концу её жизни и со временем сборки (XFetch), поэтому
+одновременного истечения под нагрузкой почти не бывает.
+"""
+import math
+import random
+import time
+
+from django.core.cache import cache as default_cache
+
+LOCK_TIMEOUT = 10
+STALE_GRACE = 60
+WAIT_TIMEOUT = 2
+POLL_INTERVAL = 0.05
+
+
+def _should_refresh(delta, expires, beta):
+    # random() бывает 0.0, а log(0) — ошибка; 1 - random() лежит в (0, 1].
+    jitter = math.log(1.0 - random.random())
+    return time.time() - delta * beta * jitter >= expires
+
+
+def _build_and_store(cache, key, build, timeout):
+    started = time.time()
+    value = build()
+    finished = time.time()
+    cache.set(
+        key,
+        (value, finished - started, finished + timeout),
+        timeout + STALE_GRACE,
+    )
+    return value
+
+
+def get_or_build(key, build, timeout, cache=None, beta=1.0,
+                 wait=WAIT_TIMEOUT):
+    """Значение из кеша или результат build(), посчитанный одним воркером."""
+    cache = cache or default_cache
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not _should_refresh(delta, expires, beta):
+            return value
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, True, LOCK_TIMEOUT):
+        try:
+            return _build_and_store(cache, key, build, timeout)
+        finally:
+            cache.delete(lock_key)
+    if entry is not None:
+        return entry[0]
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    return build()
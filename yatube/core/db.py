@@ -0,0 +1,47 @@
+"""
+Настройка соединений SQLite при открытии.
+
+PRAGMA не сохраняются в файле базы (кроме journal_mode), поэтому их надо
+выполнять на каждом новом соединении. Значения берутся из ключа PRAGMAS
+в описании базы в DATABASES:
+
+    'PRAGMAS': {'journal_mode': 'wal', 'synchronous': 'normal', ...}
+
+В режиме WAL читатели не ждут писателя, synchronous=NORMAL в WAL
+сбрасывает данные на диск только на контрольных точках, busy_timeout
+заставляет писателя подождать блокировку вместо «database is locked».
+"""
+import re
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def pragma_statements(pragmas):
+    """PRAGMA в том порядке, в котором они заданы в настройках."""
+    statements = []
+    for name, value in pragmas.items():
+        value = str(value)
+        if not PRAGMA_NAME.match(name) or not PRAGMA_VALUE.match(value):
+            raise ValueError(f'Недопустимая PRAGMA: {name}={value}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = connection.settings_dict.get('PRAGMAS')
+    if not pragmas:
+        return
+    # Курсор самого sqlite3: PRAGMA не попадают в connection.queries.
+    cursor = connection.connection.cursor()
+    try:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
+    finally:
+        cursor.close()
@@ -0,0 +1,68 @@
+"""
+Движок и бэкенд sorl-thumbnail для современных форматов.
+
+Бэкенд знает расширение AVIF, если Pillow умеет его сохранять, а движок
+переводит картинку в sRGB по её ICC-профилю и сохраняет миниатюру без
+метаданных: EXIF, XMP и профиль в миниатюре только добавляют байты.
+"""
+import io
+
+from PIL import Image, ImageCms
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.engines.pil_engine import Engine as PILEngine
+from sorl.thumbnail.helpers import serialize, tokey
+
+FORMAT_EXTENSIONS = {**EXTENSIONS, 'AVIF': 'avif'}
+FORMAT_SAVE_OPTIONS = {
+    'JPEG': {'optimize': True},
+    'WEBP': {'method': 6},
+    'AVIF': {'speed': 6},
+}
+
+
+def can_save(format_):
+    """Умеет ли установленный Pillow сохранять картинки в этом формате."""
+    Image.init()
+    return format_ in Image.SAVE
+
+
+class Backend(ThumbnailBackend):
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = f'{key[:2]}/{key[2:4]}/{key}'
+        extension = FORMAT_EXTENSIONS[options['format']]
+        return f'{settings.THUMBNAIL_PREFIX}{path}.{extension}'
+
+
+class Engine(PILEngine):
+    def _to_srgb(self, image, image_info):
+        profile = image_info.get('icc_profile')
+        if not profile or image.mode not in ('RGB', 'RGBA'):
+            return image
+        try:
+            return ImageCms.profileToProfile(
+                image,
+                ImageCms.ImageCmsProfile(io.BytesIO(profile)),
+                ImageCms.createProfile('sRGB'),
+                outputMode=image.mode,
+            )
+        except (ImageCms.PyCMSError, OSError):
+            return image
+
+    def _get_raw_data(self, image, format_, quality, image_info=None,
+                      progressive=False):
+        image = self._to_srgb(image, image_info or {})
+        params = {'format': format_, 'quality': quality}
+        params.update(FORMAT_SAVE_OPTIONS.get(format_, {}))
+        if format_ == 'JPEG' and progressive:
+            params['progressive'] = True
+        with io.BytesIO() as buffer:
+            try:
+                image.save(buffer, **params)
+            except OSError:
+                params.pop('optimize', None)
+                buffer.seek(0)
+                buffer.truncate()
+                image.save(buffer, **params)
+            return buffer.getvalue()
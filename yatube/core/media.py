@@ -0,0 +1,211 @@
+"""
+Раздача файлов из MEDIA_ROOT и STATIC_ROOT.
+
+В отличие от django.views.static.serve вьюха отвечает 304 по ETag и
+дате изменения, отдаёт диапазоны байтов и помечает неизменяемыми файлы,
+имя которых — хеш содержимого (картинки постов и миниатюры sorl). Если
+задан MEDIA_SENDFILE, сам файл отдаёт веб-сервер по X-Accel-Redirect
+(nginx) или X-Sendfile (Apache), а воркер пишет только заголовки.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from stat import S_ISREG
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         HttpResponseNotModified, StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MUTABLE_MAX_AGE = 60 * 60 * 24
+IMMUTABLE_NAME = re.compile(
+    r'^\w+/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32,64}\.\w+$'
+)
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def file_etag(stat):
+    """Сильный ETag из размера и времени изменения файла."""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in tags or '*' in tags
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+    return since is not None and int(mtime) <= since
+
+
+def parse_range(header, size):
+    """
+    Один диапазон из заголовка Range: (начало, конец) включительно.
+
+    None — заголовок не понят или диапазонов несколько, тогда отдаётся
+    весь файл. ValueError — диапазон за пределами файла.
+    """
+    match = RANGE_HEADER.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or first > last:
+        raise ValueError(header)
+    return first, last
+
+
+def _range_applies(request, etag, mtime):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def _read_range(path, first, last):
+    with open(path, 'rb') as file:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload(name, path):
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        return 'X-Accel-Redirect', settings.MEDIA_ACCEL_PREFIX + name
+    if settings.MEDIA_SENDFILE == 'x-sendfile':
+        return 'X-Sendfile', path
+    return None
+
+
+def _response(request, path, stat, etag, offload):
+    if offload is not None:
+        response = HttpResponse()
+        header, value = offload
+        response[header] = value
+        return response
+    size = stat.st_size
+    header = request.META.get('HTTP_RANGE')
+    if header and _range_applies(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is not None:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                _read_range(path, first, last), status=206
+            )
+            response['Content-Range'] = f'bytes {first}-{last}/{size}'
+            response['Content-Length'] = last - first + 1
+            return response
+    return FileResponse(open(path, 'rb'))
+
+
+def _stat_file(path):
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat if S_ISREG(stat.st_mode) else None
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, которые клиент не запретил q=0."""
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _precompressed(request, path):
+    """Сжатая заранее копия файла, которую примет клиент, и её stat."""
+    accepted = accepted_encodings(request)
+    for encoding, extension in PRECOMPRESSED:
+        if encoding in accepted:
+            stat = _stat_file(path + extension)
+            if stat is not None:
+                return encoding, path + extension, stat
+    return None
+
+
+def serve_file(request, root, path, immutable=False, offload=None,
+               precompressed=False):
+    """
+    Файл из каталога root с валидаторами, диапазонами и Cache-Control.
+
+    immutable — файл никогда не меняется под этим именем. offload —
+    (заголовок, значение) для отдачи тела веб-сервером. precompressed —
+    искать рядом копии .br и .gz и отдавать ту, что примет клиент.
+    """
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(root, name)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден.')
+    stat = _stat_file(full_path)
+    if stat is None:
+        raise Http404('Файл не найден.')
+    content_type, encoding = mimetypes.guess_type(full_path)
+    variant = _precompressed(request, full_path) if precompressed else None
+    body_path = full_path
+    if variant is not None:
+        encoding, body_path, stat = variant
+    etag = file_etag(stat)
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = _response(request, body_path, stat, etag, offload)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+    if precompressed:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    max_age = IMMUTABLE_MAX_AGE if immutable else MUTABLE_MAX_AGE
+    response['Cache-Control'] = f'public, max-age={max_age}'
+    if immutable:
+        response['Cache-Control'] += ', immutable'
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """Файл из MEDIA_ROOT; имена-хеши кешируются навсегда."""
+    name = posixpath.normpath(path).lstrip('/')
+    return serve_file(
+        request,
+        settings.MEDIA_ROOT,
+        name,
+        immutable=bool(IMMUTABLE_NAME.match(name)),
+        offload=_offload(name, os.path.join(settings.MEDIA_ROOT, name)),
+    )
@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.deprecation import MiddlewareMixin
+
+COMPRESSIBLE_TYPES = frozenset((
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/json',
+    'application/javascript',
+    'image/svg+xml',
+))
+
+
+class TextGZipMiddleware(GZipMiddleware):
+    """
+    Сжимает gzip только готовые текстовые ответы не короче GZIP_MIN_LENGTH.
+
+    Файлы media и статика отдаются потоком — уже сжатыми или в форматах,
+    которые gzip не уменьшит; короткие страницы не стоят затрат на сжатие.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type.strip().lower() not in COMPRESSIBLE_TYPES:
+            return response
+        if len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """
+    Ставит куку со временем записи: чтения автора идут только на копии,
+    снятые после неё (core.replicas). Дольше REPLICA_MAX_LAG она не
+    нужна — более старые копии и так не читаются.
+    """
+
+    def process_response(self, request, response):
+        if not settings.REPLICA_DATABASES or response.status_code >= 400:
+            return response
+        wrote = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        if wrote or getattr(request, 'pin_to_primary', False):
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                f'{time.time():.3f}',
+                max_age=settings.REPLICA_MAX_LAG,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
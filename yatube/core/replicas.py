@@ -0,0 +1,158 @@
+"""
+Чтение лент с копий базы.
+
+Вьюхи, обёрнутые в read_from_replica, читают с одного из псевдонимов
+REPLICA_DATABASES, выбранного случайно на запрос; всё остальное и любая
+запись идут в default. Сессии и пользователи (приложения PRIMARY_APPS)
+всегда читаются с default, чтобы отставшая копия не разлогинила
+пользователя.
+
+Копии SQLite обновляет команда sync_replicas через backup API и
+запоминает в кеше, когда начат снимок каждой копии: в нём есть всё,
+что зафиксировано до этого момента. Копия, снятая раньше, чем
+REPLICA_MAX_LAG секунд назад, считается отставшей и не читается.
+После POST или вьюхи, обёрнутой в pin_to_primary, браузер получает
+куку REPLICA_PIN_COOKIE со временем записи (ReplicaPinMiddleware), и
+его чтения идут только на копии, снятые после неё, а пока таких нет —
+в default. Так окно определяется фактическим отставанием копий.
+"""
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+PRIMARY_APPS = frozenset(('auth', 'sessions'))
+SYNCED_KEY_PREFIX = 'core:replicas:synced'
+SYNC_BUSY_TIMEOUT = 30
+SYNC_ATTEMPTS = 3
+
+_state = threading.local()
+
+
+def current_replica():
+    """Псевдоним копии, с которой читает текущий запрос, или None."""
+    return getattr(_state, 'alias', None)
+
+
+def _synced_key(alias):
+    return f'{SYNCED_KEY_PREFIX}:{alias}'
+
+
+def mark_synced(alias, started):
+    """Запоминает, что копия alias содержит все записи до started."""
+    cache.set(_synced_key(alias), started, None)
+
+
+def written_at(request):
+    """Время последней записи пользователя из куки или 0."""
+    try:
+        return float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE))
+    except (TypeError, ValueError):
+        return 0
+
+
+def fresh_replicas(since=0):
+    """Копии, снятые после since и не раньше REPLICA_MAX_LAG назад."""
+    replicas = settings.REPLICA_DATABASES
+    if not replicas:
+        return []
+    synced = cache.get_many([_synced_key(alias) for alias in replicas])
+    oldest = max(since, time.time() - settings.REPLICA_MAX_LAG)
+    return [
+        alias for alias in replicas
+        if synced.get(_synced_key(alias), 0) >= oldest
+    ]
+
+
+def read_from_replica(view):
+    """Направляет чтения вьюхи, её условного GET и шаблона на копию."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replicas = fresh_replicas(written_at(request))
+        if not replicas:
+            return view(request, *args, **kwargs)
+        previous, _state.alias = current_replica(), random.choice(replicas)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _state.alias = previous
+    return wrapper
+
+
+def pin_to_primary(view):
+    """Отмечает вьюху, после которой чтения пользователя идут в default."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.pin_to_primary = True
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Чтение — с копии текущего запроса, запись — всегда в default."""
+
+    def db_for_read(self, model, **hints):
+        if model is not None and model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        # Без явного default Django читал бы связанные строки с базы
+        # объекта-подсказки, а это может быть шард постов.
+        return current_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.REPLICA_DATABASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
+        return None
+
+
+def _wait_for_readers(target, timeout):
+    """Ждёт до timeout секунд, пока читатели копии отпустят её."""
+    target_db = sqlite3.connect(target, timeout=timeout, isolation_level=None)
+    try:
+        target_db.execute('BEGIN EXCLUSIVE')
+        target_db.execute('ROLLBACK')
+    finally:
+        target_db.close()
+
+
+def copy_database(source, target, timeout=SYNC_BUSY_TIMEOUT,
+                  attempts=SYNC_ATTEMPTS):
+    """
+    Согласованный снимок файла SQLite source поверх target.
+
+    Соединения читателей живут CONN_MAX_AGE и держат на копии
+    блокировки, а backup ждал бы их без срока. Поэтому сначала копия
+    захватывается на запись с busy-таймаутом timeout; если читатели её
+    не отпустили, попытка повторяется, а после attempts неудач
+    OperationalError уходит наверх. Короткие чтения, начатые между
+    захватом и снимком, backup дожидается сам.
+    """
+    for attempt in range(attempts):
+        try:
+            _wait_for_readers(target, timeout)
+            break
+        except sqlite3.OperationalError:
+            if attempt == attempts - 1:
+                raise
+    source_db = sqlite3.connect(source, timeout=timeout)
+    try:
+        target_db = sqlite3.connect(target, timeout=timeout)
+        try:
+            source_db.backup(target_db)
+        finally:
+            target_db.close()
+    finally:
+        source_db.close()
@@ -0,0 +1,98 @@
+"""
+Статика с хешем содержимого в имени и заранее сжатыми копиями.
+
+collectstatic кладёт в STATIC_ROOT файлы вида style.0123456789ab.css и
+рядом с текстовыми — .gz и, если установлен пакет brotli, .br. Такие
+имена не меняются без смены содержимого, поэтому serve_static отдаёт их
+с Cache-Control immutable на год, а сжатую копию выбирает по
+Accept-Encoding без сжатия на каждый запрос.
+"""
+import gzip
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.views.decorators.http import require_safe
+
+from .media import PRECOMPRESSED, serve_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = frozenset((
+    '.css', '.js', '.map', '.svg', '.txt', '.json', '.xml', '.html', '.ico',
+))
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data)
+
+
+def compressors():
+    """Пары (расширение копии, функция сжатия) для доступных кодеков."""
+    available = {'.gz': _gzip}
+    if brotli is not None:
+        available['.br'] = _brotli
+    return [
+        (extension, available[extension])
+        for _, extension in PRECOMPRESSED
+        if extension in available
+    ]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который сжимает текстовую статику."""
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # Без collectstatic (тесты, разработка) файла в STATIC_ROOT нет:
+        # тогда отдаётся исходное имя, а не ValueError при рендере.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed = super().post_process(paths, dry_run=dry_run, **options)
+        for name, hashed_name, processed_ in processed:
+            if not dry_run and isinstance(hashed_name, str):
+                for path in {name, hashed_name}:
+                    self._compress(path)
+            yield name, hashed_name, processed_
+
+    def _compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        with self.open(name) as file:
+            data = file.read()
+        for extension, compress in compressors():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(compressed))
+
+
+@require_safe
+def serve_static(request, path):
+    """Файл из STATIC_ROOT; имена с хешем кешируются навсегда."""
+    name = posixpath.normpath(path).lstrip('/')
+    return serve_file(
+        request,
+        settings.STATIC_ROOT,
+        name,
+        immutable=bool(HASHED_NAME.search(name)),
+        precompressed=True,
+    )
@@ -0,0 +1,54 @@
+"""
+Хранилище загрузок с адресацией по содержимому.
+
+Имя файла — SHA-256 его байтов, разложенный по подкаталогам из первых
+символов хеша, поэтому одинаковые загрузки занимают одно место на диске,
+а ни в одном каталоге не скапливаются сотни тысяч файлов. Хеш считается
+по кускам загрузки, файл целиком в памяти не держится.
+
+Повторная загрузка уже лежащего файла обновляет его mtime: сборщик
+мусора (posts.orphans) не трогает свежие файлы и перепроверяет их перед
+удалением, так что файл, только что снова понадобившийся, он не удалит.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+
+def content_digest(content):
+    """SHA-256 файла, прочитанного кусками; позиция возвращается в начало."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def sharded_name(name, digest):
+    """posts/x.gif -> posts/ab/cd/abcd...ef.gif"""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    shards = [
+        digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH]
+        for i in range(SHARD_DEPTH)
+    ]
+    return os.path.join(directory, *shards, digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        name = sharded_name(name, content_digest(content))
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super()._save(name, content)
+        return name
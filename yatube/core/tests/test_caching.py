@@ -0,0 +1,127 @@
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from core.caching import backends
+from core.caching.backends import SQLiteCache
+from core.caching.coalescing import get_or_build
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = f'{self.directory}/cache.sqlite3'
+        self.cache = self.make_cache()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def forget_process_state(self):
+        """Имитирует другой процесс: свой L1 над тем же файлом."""
+        backends._l1_caches.pop(self.location)
+        backends._stamp_files.pop(self.location)
+        return self.make_cache()
+
+    def test_basic_operations(self):
+        """set/get/add/delete/incr работают как у штатных бэкендов."""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.assertEqual(self.cache.get('counter'), 3)
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'missing']), {'a': 1, 'b': 2}
+        )
+        self.cache.clear()
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_expired_values_are_missing(self):
+        """Просроченные записи не отдаются ни из L1, ни из SQLite."""
+        self.cache.set('key', 'value', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'fresh'))
+
+    def test_write_in_other_process_invalidates_l1(self):
+        """Запись в одном процессе сбрасывает L1 в другом."""
+        other = self.forget_process_state()
+        self.cache.set('key', 'old')
+        self.assertEqual(other.get('key'), 'old')
+        self.cache.set('key', 'new')
+        self.assertEqual(other.get('key'), 'new')
+        self.cache.delete('key')
+        self.assertIsNone(other.get('key'))
+
+    def test_l1_serves_repeated_reads(self):
+        """Повторное чтение без записи не ходит в SQLite."""
+        self.cache.set('key', 'value')
+        self.cache._connection.close()
+        self.cache._connection = None
+        self.cache._path = f'{self.directory}/missing/cache.sqlite3'
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_cull_keeps_table_bounded(self):
+        """Лишние записи вычищаются по мере записи."""
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        cache.set_many({f'key{i}': i for i in range(backends.CULL_EVERY)})
+        count = cache._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertLessEqual(count, backends.CULL_EVERY // 2)
+
+
+class GetOrBuildTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocMemCache('coalescing-tests', {})
+        self.cache.clear()
+        self.calls = 0
+
+    def build(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return f'value {self.calls}'
+
+    def test_concurrent_misses_build_once(self):
+        """Одновременные промахи пересобирают значение один раз."""
+        results = []
+
+        def worker():
+            results.append(get_or_build('key', self.build, 60, self.cache))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['value 1'] * 5)
+
+    def test_stale_copy_served_while_rebuilding(self):
+        """Пока другой воркер пересобирает, отдаётся устаревшая копия."""
+        self.cache.set('key', ('stale', 0.1, time.time() - 1), 60)
+        self.cache.add('key:lock', True, 60)
+        value = get_or_build('key', self.build, 60, self.cache)
+        self.assertEqual(value, 'stale')
+        self.assertEqual(self.calls, 0)
+
+    @mock.patch('core.caching.coalescing.random.random', return_value=0.5)
+    def test_early_expiration(self, _random):
+        """Дорогое значение пересобирается ещё до формального истечения."""
+        self.cache.set('key', ('old', 10.0, time.time() + 1), 60)
+        value = get_or_build('key', self.build, 60, self.cache, beta=100)
+        self.assertEqual(value, 'value 1')
+
+    @mock.patch('core.caching.coalescing.random.random', return_value=0.0)
+    def test_zero_random_keeps_fresh_value(self, _random):
+        """random() == 0.0 не ломает проверку досрочного истечения."""
+        self.cache.set('key', ('fresh', 0.1, time.time() + 60), 60)
+        value = get_or_build('key', self.build, 60, self.cache)
+        self.assertEqual(value, 'fresh')
@@ -0,0 +1,56 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from ..backends.sqlite3.base import DatabaseWrapper
+from ..db import pragma_statements
+
+
+class PragmaTests(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        """PRAGMA из DATABASES выполняются на новом соединении."""
+        pragmas = connection.settings_dict['PRAGMAS']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], pragmas['busy_timeout'])
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], pragmas['cache_size'])
+
+    def test_invalid_pragma_rejected(self):
+        """Имя и значение PRAGMA не подставляются в SQL как есть."""
+        with self.assertRaises(ValueError):
+            pragma_statements({'cache_size': '1; DROP TABLE posts_post'})
+
+
+class ImmediateTransactionTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.wrapper = DatabaseWrapper(
+            {
+                **connection.settings_dict,
+                'NAME': self.path,
+                'TRANSACTION_MODE': 'IMMEDIATE',
+            },
+            alias='immediate',
+        )
+
+    def tearDown(self):
+        self.wrapper.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_transaction_takes_write_lock_at_begin(self):
+        """BEGIN IMMEDIATE берёт блокировку записи до первого запроса."""
+        self.wrapper.ensure_connection()
+        self.wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.wrapper.connection.execute('ROLLBACK')
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+
+MEDIA_ROOT = tempfile.mkdtemp()
+HASHED_NAME = 'cache/ab/cd/abcdef0123456789abcdef0123456789.jpg'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ServeMediaTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('posts/plain.gif', HASHED_NAME):
+            path = os.path.join(MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(b'0123456789')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file_with_validators(self):
+        """Файл отдаётся целиком с ETag и Last-Modified."""
+        response = self.client.get('/media/posts/plain.gif')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_not_modified(self):
+        """Совпавший ETag или неизменённая дата дают 304."""
+        response = self.client.get('/media/posts/plain.gif')
+        etag = response['ETag']
+        modified = response['Last-Modified']
+        response = self.client.get(
+            '/media/posts/plain.gif', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(
+            '/media/posts/plain.gif', HTTP_IF_MODIFIED_SINCE=modified
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_byte_ranges(self):
+        """Диапазоны отдаются с 206, невыполнимые — с 416."""
+        cases = {
+            'bytes=2-4': (206, b'234', 'bytes 2-4/10'),
+            'bytes=7-': (206, b'789', 'bytes 7-9/10'),
+            'bytes=-2': (206, b'89', 'bytes 8-9/10'),
+        }
+        for header, (status, body, content_range) in cases.items():
+            with self.subTest(header=header):
+                response = self.client.get(
+                    '/media/posts/plain.gif', HTTP_RANGE=header
+                )
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(
+                    b''.join(response.streaming_content), body
+                )
+                self.assertEqual(response['Content-Range'], content_range)
+        response = self.client.get(
+            '/media/posts/plain.gif', HTTP_RANGE='bytes=20-'
+        )
+        self.assertEqual(response.status_code, 416)
+        response = self.client.get(
+            '/media/posts/plain.gif',
+            HTTP_RANGE='bytes=2-4',
+            HTTP_IF_RANGE='"stale"',
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_hashed_names_are_immutable(self):
+        """Файлы с хешем в имени кешируются навсегда."""
+        response = self.client.get(f'/media/{HASHED_NAME}')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_missing_and_outside_files(self):
+        """Несуществующие файлы и пути за MEDIA_ROOT дают 404."""
+        for url in ('/media/posts/missing.gif', '/media/../manage.py',
+                    '/media/posts/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect')
+    def test_accel_redirect(self):
+        """С MEDIA_SENDFILE тело отдаёт веб-сервер."""
+        response = self.client.get('/media/posts/plain.gif')
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/plain.gif'
+        )
+        self.assertEqual(response.content, b'')
@@ -0,0 +1,129 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..middleware import ReplicaPinMiddleware
+from ..replicas import (ReplicaRouter, copy_database, current_replica,
+                        mark_synced, pin_to_primary, read_from_replica)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def routed_read(self, request, model=None):
+        @read_from_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(model))
+        return view(request).content.decode()
+
+    def test_feed_reads_go_to_replica(self):
+        """Обёрнутая вьюха читает с копии, запись всегда в default."""
+        mark_synced('replica1', time.time())
+        self.assertEqual(self.routed_read(self.factory.get('/')), 'replica1')
+        self.assertIsNone(current_replica())
+        self.assertEqual(self.router.db_for_write(None), 'default')
+
+    def test_lagging_replica_is_skipped(self):
+        """Копия без снимка или со старым снимком не читается."""
+        request = self.factory.get('/')
+        self.assertEqual(self.routed_read(request), 'default')
+        mark_synced('replica1', time.time() - settings.REPLICA_MAX_LAG - 1)
+        self.assertEqual(self.routed_read(request), 'default')
+
+    def test_reads_after_write_wait_for_sync(self):
+        """После записи чтения идут в default, пока копию не снимут заново."""
+        written = time.time()
+        mark_synced('replica1', written - 1)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = f'{written:.3f}'
+        self.assertEqual(self.routed_read(request), 'default')
+        mark_synced('replica1', written + 1)
+        self.assertEqual(self.routed_read(request), 'replica1')
+
+    def test_sessions_and_users_read_from_primary(self):
+        """Сессии и пользователи читаются с default даже внутри копии."""
+        mark_synced('replica1', time.time())
+        request = self.factory.get('/')
+        for model in (Session, get_user_model()):
+            with self.subTest(model=model):
+                self.assertEqual(self.routed_read(request, model), 'default')
+
+    def test_writes_set_pin_cookie(self):
+        """Кука ставится после POST и вьюх pin_to_primary, но не после GET."""
+        middleware = ReplicaPinMiddleware(lambda request: HttpResponse())
+        response = middleware(self.factory.post('/'))
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        response = middleware(self.factory.get('/'))
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        pin_to_primary(lambda request: None)(request)
+        response = middleware(request)
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+
+
+class CopyDatabaseTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+        self.source = os.path.join(self.directory, 'default.sqlite3')
+        self.target = os.path.join(self.directory, 'replica.sqlite3')
+        db = sqlite3.connect(self.source)
+        db.execute('CREATE TABLE post (text TEXT)')
+        db.execute("INSERT INTO post VALUES ('первый')")
+        db.commit()
+        db.close()
+
+    def replica_rows(self):
+        replica = sqlite3.connect(self.target)
+        try:
+            return replica.execute('SELECT text FROM post').fetchall()
+        finally:
+            replica.close()
+
+    def hold_read_lock(self):
+        """Читатель с открытой транзакцией на копии, как у CONN_MAX_AGE."""
+        copy_database(self.source, self.target)
+        reader = sqlite3.connect(
+            self.target, isolation_level=None, check_same_thread=False
+        )
+        self.addCleanup(reader.close)
+        reader.execute('BEGIN')
+        reader.execute('SELECT * FROM post').fetchall()
+        return reader
+
+    def test_replica_gets_snapshot(self):
+        """Копия получает все строки основной базы."""
+        copy_database(self.source, self.target)
+        self.assertEqual(self.replica_rows(), [('первый',)])
+
+    def test_busy_replica_fails_after_attempts(self):
+        """Копия, которую читатель не отпускает, даёт ошибку, а не виснет."""
+        self.hold_read_lock()
+        with self.assertRaises(sqlite3.OperationalError):
+            copy_database(self.source, self.target, timeout=0.1, attempts=2)
+
+    def test_sync_waits_for_reader(self):
+        """Снимок дожидается, пока читатель закончит транзакцию."""
+        reader = self.hold_read_lock()
+        db = sqlite3.connect(self.source)
+        db.execute("INSERT INTO post VALUES ('второй')")
+        db.commit()
+        db.close()
+        threading.Timer(0.2, reader.execute, ['COMMIT']).start()
+        copy_database(self.source, self.target, timeout=0.1, attempts=10)
+        self.assertEqual(self.replica_rows(), [('первый',), ('второй',)])
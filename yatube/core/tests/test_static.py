@@ -0,0 +1,87 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from ..middleware import TextGZipMiddleware
+
+STATIC_ROOT = tempfile.mkdtemp()
+CSS = b'body { color: black; }\n' * 100
+
+
+@override_settings(STATIC_ROOT=STATIC_ROOT)
+class StaticPipelineTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.source, 'css'))
+        with open(os.path.join(cls.source, 'css', 'site.css'), 'wb') as file:
+            file.write(CSS)
+        with override_settings(
+            STATIC_ROOT=STATIC_ROOT, STATICFILES_DIRS=[cls.source]
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            staticfiles_storage.hashed_files.clear()
+            cls.hashed = staticfiles_storage.stored_name('css/site.css')
+            staticfiles_storage.hashed_files.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(STATIC_ROOT, ignore_errors=True)
+        shutil.rmtree(cls.source, ignore_errors=True)
+
+    def test_collectstatic_hashes_and_compresses(self):
+        """collectstatic даёт имя с хешем и сжатую копию рядом."""
+        hashed = StaticPipelineTests.hashed
+        self.assertRegex(hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(STATIC_ROOT, hashed + '.gz'), 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), CSS)
+
+    def test_precompressed_immutable(self):
+        """Клиенту с gzip отдаётся копия .gz с immutable-кешем."""
+        url = '/static/' + StaticPipelineTests.hashed
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('immutable', response['Cache-Control'])
+        body = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(body, CSS)
+
+    def test_identity_and_unhashed(self):
+        """Без gzip — исходный файл; имя без хеша не кешируется навсегда."""
+        url = '/static/' + StaticPipelineTests.hashed
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(b''.join(response.streaming_content), CSS)
+        response = self.client.get('/static/css/site.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+
+@override_settings(GZIP_MIN_LENGTH=1024)
+class TextGZipMiddlewareTests(SimpleTestCase):
+    def process(self, content, content_type='text/html; charset=utf-8'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = HttpResponse(content, content_type=content_type)
+        middleware = TextGZipMiddleware(lambda request: response)
+        return middleware(request)
+
+    def test_large_html_compressed(self):
+        """Большая HTML-страница сжимается."""
+        response = self.process(b'<p>yatube</p>' * 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_small_or_binary_not_compressed(self):
+        """Короткие страницы и картинки отдаются как есть."""
+        response = self.process(b'<p>yatube</p>' * 10)
+        self.assertNotIn('Content-Encoding', response)
+        response = self.process(b'\x00' * 4096, 'image/png')
+        self.assertNotIn('Content-Encoding', response)
@@ -13,5 +13,13 @@ def server_error(request):
     return render(request, 'core/500.html', status=500)
 
 
+def service_unavailable(request, ambiguous=False):
+    response = render(
+        request, 'core/503.html', {'ambiguous': ambiguous}, status=503
+    )
+    response['Retry-After'] = 5
+    return response
+
+
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
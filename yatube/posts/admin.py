@@ -1,14 +1,180 @@
-from django.contrib import admin
+import hashlib
+from itertools import islice
 
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import sharding
+from .caching import bump_all, feed_key
+from .constants import ADMIN_DELETE_BATCH_SIZE
 from .models import Group, Post
+from .search import match_expression
+from .utils import CachedCountPaginator
+
+
+class PostAdminPaginator(CachedCountPaginator):
+    """Число строк списка кешируется до любой правки постов."""
+
+    def __init__(self, object_list, per_page, orphans=0,
+                 allow_empty_first_page=True):
+        count_key = None
+        try:
+            query = str(object_list.query)
+        except EmptyResultSet:
+            query = None
+        if query is not None:
+            # Запросы к разным шардам совпадают текстом.
+            query = f'{object_list.db}:{query}'
+            digest = hashlib.md5(query.encode()).hexdigest()
+            count_key = feed_key('admin', digest, depends_on=[('index',)])
+        super().__init__(
+            object_list,
+            per_page,
+            count_key,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+        )
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Список постов одного шарда, по умолчанию — первого. Через него же
+    на шард идут действия: они получают выборку списка.
+    """
+
+    title = 'шард'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in sharding.shards()]
+
+    def shard(self):
+        if self.value() in sharding.shards():
+            return self.value()
+        return sharding.shards()[0]
+
+    def choices(self, changelist):
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': alias == self.shard(),
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: alias}
+                ),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        return queryset.using(self.shard())
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        required=False,
+        label='Группа',
+        empty_label='-пусто-',
+    )
 
 
 class PostAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
-    list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    raw_id_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
+    date_hierarchy = 'pub_date'
     empty_value_display = '-пусто-'
+    show_full_result_count = False
+    paginator = PostAdminPaginator
+    action_form = PostActionForm
+    actions = ('reassign_group', 'delete_posts')
+
+    def get_queryset(self, request):
+        return sharding.related(
+            super().get_queryset(request), *self.list_select_related
+        )
+
+    def get_list_select_related(self, request):
+        # Авторы и группы лежат в default: с шардами их подтягивает
+        # prefetch_related из get_queryset, а не JOIN.
+        if sharding.enabled():
+            return ()
+        return self.list_select_related
+
+    def get_list_filter(self, request):
+        if sharding.enabled():
+            return (ShardListFilter, *self.list_filter)
+        return self.list_filter
+
+    def get_object(self, request, object_id, from_field=None):
+        if not sharding.enabled() or from_field is not None:
+            return super().get_object(request, object_id, from_field)
+        try:
+            using = sharding.shard_for_post(int(object_id))
+        except ValueError:
+            return None
+        return self.get_queryset(request).using(using).filter(
+            pk=object_id
+        ).first()
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        expression = match_expression(search_term)
+        if connection.vendor != 'sqlite' or not expression:
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        matches = (
+            f'{Post._meta.db_table}.id IN (SELECT rowid FROM posts_post_fts '
+            'WHERE posts_post_fts MATCH %s)'
+        )
+        return queryset.extra(where=[matches], params=[expression]), False
+
+    def reassign_group(self, request, queryset):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            self.message_user(request, 'Выберите группу.', messages.ERROR)
+            return
+        updated = queryset.update(
+            group=form.cleaned_data['group'], updated=timezone.now()
+        )
+        bump_all()
+        self.message_user(request, f'Группа изменена у {updated} постов.')
+    reassign_group.short_description = 'Перенести в выбранную группу'
+
+    def delete_posts(self, request, queryset):
+        """
+        Удаляет посты пачками обычным delete: сигналы поправляют
+        счётчики, ленты и кеш карточек, а каскад убирает комментарии и
+        записи лент. Файлы картинок общие у одинаковых загрузок, их
+        убирает collect_media_garbage. Удаление идёт на шарде списка.
+        """
+        using = queryset.db
+        post_ids = iter(list(
+            queryset.order_by('pk').values_list('pk', flat=True)
+        ))
+        deleted = 0
+        batch = list(islice(post_ids, ADMIN_DELETE_BATCH_SIZE))
+        while batch:
+            with transaction.atomic(using=using):
+                _, per_model = Post.objects.using(using).filter(
+                    pk__in=batch
+                ).delete()
+            deleted += per_model.get(Post._meta.label, 0)
+            batch = list(islice(post_ids, ADMIN_DELETE_BATCH_SIZE))
+        bump_all()
+        self.message_user(request, f'Удалено постов: {deleted}.')
+    delete_posts.short_description = 'Удалить выбранные посты'
+    delete_posts.allowed_permissions = ('delete',)
 
 
 admin.site.register(Post, PostAdmin)
@@ -0,0 +1,92 @@
+"""
+Версионные ключи кеша лент.
+
+У каждой ленты (общей, группы, автора, подписок пользователя, поста)
+есть поколение — случайная метка в кеше. Она входит в ключ фрагмента,
+поэтому смена метки сигналом сразу делает старые фрагменты
+недостижимыми, и они могут жить в кеше часами. Все ключи зависят
+ещё и от общего поколения ALL_FEEDS, которое сбрасывает bump_all.
+
+Запрос, который читает с копии базы (core.replicas), добавляет к ключам
+поколение REPLICA_FEED. Его меняет sync_replicas после каждого
+обновления копий, поэтому отставшая копия не оставляет в кеше страницу
+под новым поколением ленты дольше, чем до следующей синхронизации.
+"""
+import uuid
+
+from core.replicas import current_replica
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY_PREFIX = 'posts:version'
+ALL_FEEDS = ('all',)
+REPLICA_FEED = ('replicas',)
+
+
+def _version_key(parts):
+    return ':'.join([VERSION_KEY_PREFIX, *map(str, parts)])
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def versions(*feeds):
+    """Текущие поколения лент одним запросом в кеш."""
+    keys = [_version_key(feed) for feed in feeds]
+    found = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+class FeedKey(str):
+    """Ключ ленты; name — та же лента без поколений."""
+
+    name = ''
+
+
+def replica_feeds():
+    """[REPLICA_FEED], если текущий запрос читает с копии базы."""
+    return [REPLICA_FEED] if current_replica() is not None else []
+
+
+def feed_key(*parts, depends_on=()):
+    """Ключ ленты с поколением её самой и лент, от которых она зависит."""
+    feeds = [parts, ALL_FEEDS, *depends_on, *replica_feeds()]
+    key = FeedKey(':'.join([*map(str, parts), *versions(*feeds)]))
+    key.name = ':'.join(map(str, parts))
+    return key
+
+
+def bump(*feeds):
+    """Начинает новое поколение у перечисленных лент."""
+    cache.set_many(
+        {_version_key(feed): _new_version() for feed in feeds}, None
+    )
+
+
+def bump_on_commit(*feeds, using=None):
+    """
+    bump после фиксации транзакции на базе using, вне транзакции — сразу.
+    Иначе читатель между bump и COMMIT положил бы старые строки под
+    новым поколением, и они жили бы в кеше до истечения.
+    """
+    transaction.on_commit(lambda: bump(*feeds), using=using)
+
+
+def bump_all():
+    """Сбрасывает все ленты разом, например после массовой правки."""
+    bump(ALL_FEEDS)
+
+
+def post_feeds(post, followers=()):
+    """Ленты, в которых показан пост, включая его прежнюю группу."""
+    feeds = [('index',), ('profile', post.author_id), ('post', post.pk)]
+    initial_group_id = getattr(post, '_initial_group_id', None)
+    for group_id in {post.group_id, initial_group_id} - {None}:
+        feeds.append(('group', group_id))
+    feeds.extend(('follow', user_id) for user_id in followers)
+    return feeds
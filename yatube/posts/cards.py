@@ -0,0 +1,48 @@
+"""
+Карточки постов, общие для всех лент.
+
+Главная, группа, профиль и подписки показывают пост одной и той же
+разметкой, поэтому она рендерится один раз и кешируется по id поста и
+времени его изменения. Страница ленты собирается из карточек одним
+get_many; рендерятся только промахи. Ключ зависит ещё от готовности
+миниатюры и общего поколения лент, которое сбрасывает bump_all.
+"""
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .caching import ALL_FEEDS, versions
+from .constants import POST_CARD_CACHE_TIMEOUT
+from .thumbnails import schedule
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, thumbnail_ready, version):
+    return make_template_fragment_key('post_card', [
+        post.pk, post.updated.timestamp(), int(thumbnail_ready), version,
+    ])
+
+
+def render_cards(posts, thumbnails):
+    """Разметка карточек постов страницы в её порядке."""
+    posts = list(posts)
+    version, = versions(ALL_FEEDS)
+    keys = [card_key(post, post.pk in thumbnails, version) for post in posts]
+    found = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        card = found.get(key)
+        if card is None:
+            card = render_to_string(
+                CARD_TEMPLATE, {'post': post, 'thumbnails': thumbnails}
+            )
+            rendered[key] = card
+        elif post.image and post.pk not in thumbnails:
+            schedule(post.pk)
+        cards.append(mark_safe(card))
+    if rendered:
+        cache.set_many(rendered, POST_CARD_CACHE_TIMEOUT)
+    return cards
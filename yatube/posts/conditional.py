@@ -0,0 +1,84 @@
+"""
+Валидаторы условных GET для лент и страниц постов.
+
+ETag страницы собирается из поколений лент, которые она показывает
+(posts.caching), пользователя, CSRF-куки и адреса запроса. Он стоит
+одного обращения к кешу и, где нужно, одного запроса по индексу, поэтому
+на совпавший If-None-Match вьюха отвечает 304, не выбирая посты и не
+рендеря шаблон. ETag слабый: CSRF-токен в формах меняется от рендера к
+рендеру, а смысл страницы — нет.
+"""
+import hashlib
+
+from django.conf import settings
+
+from .caching import ALL_FEEDS, replica_feeds, versions
+from .models import Group, Post, User
+from .sharding import shard_for_post
+from .timeline import heavy_authors
+
+
+def page_etag(request, *feeds):
+    """Слабый ETag страницы, которая показывает перечисленные ленты."""
+    user = request.user
+    parts = [
+        request.get_full_path(),
+        str(user.pk if user.is_authenticated else ''),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *versions(ALL_FEEDS, *feeds, *replica_feeds()),
+    ]
+    digest = hashlib.md5('\n'.join(parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _viewer_feeds(request):
+    if request.user.is_authenticated:
+        return [('follow', request.user.pk)]
+    return []
+
+
+def index_etag(request):
+    return page_etag(request, ('index',))
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is None:
+        return None
+    return page_etag(request, ('group', group_id))
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    return page_etag(
+        request,
+        ('profile', author_id),
+        ('stats', author_id),
+        *_viewer_feeds(request),
+    )
+
+
+def post_etag(request, post_id):
+    author_id = Post.objects.using(shard_for_post(post_id)).filter(
+        pk=post_id
+    ).values_list('author_id', flat=True).first()
+    if author_id is None:
+        return None
+    return page_etag(request, ('post', post_id), ('profile', author_id))
+
+
+def follow_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    heavy = request.heavy_authors = heavy_authors(request.user)
+    return page_etag(
+        request,
+        ('follow', request.user.pk),
+        *[('profile', author_id) for author_id in heavy],
+    )
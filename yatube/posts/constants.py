@@ -1,2 +1,31 @@
 POST_FIRST_CHARACTERS: int = 15
 POSTS_PER_PAGE: int = 10
+CURSOR_PARAM: str = 'cursor'
+TIMELINE_FANOUT_LIMIT: int = 1000
+TIMELINE_REFILL_LIMIT: int = 800
+TIMELINE_BATCH_SIZE: int = 500
+FEED_CACHE_TIMEOUT: int = 60 * 60 * 4
+POST_CARD_CACHE_TIMEOUT: int = 60 * 60 * 24
+COUNT_CACHE_TIMEOUT: int = 60 * 60 * 24
+COUNT_REFRESH_ASYNC: bool = True
+PAGE_WINDOW: int = 3
+SEARCH_RESULTS_PER_PAGE: int = 10
+SEARCH_CACHE_TIMEOUT: int = 60 * 10
+SEARCH_MAX_TERMS: int = 8
+POST_THUMBNAIL_SIZE: tuple = (960, 339)
+POST_THUMBNAIL_WIDTHS: tuple = (480, 960)
+POST_THUMBNAIL_SIZES: str = '(max-width: 992px) 100vw, 960px'
+POST_THUMBNAIL_FORMATS: tuple = ('AVIF', 'WEBP', 'JPEG')
+POST_THUMBNAIL_QUALITY: dict = {'AVIF': 50, 'WEBP': 75, 'JPEG': 80}
+POST_THUMBNAIL_OPTIONS: dict = {'crop': 'center', 'upscale': True}
+THUMBNAIL_WORKERS: int = 2
+POST_IMAGE_MAX_BYTES: int = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS: int = 40_000_000
+GC_BATCH_SIZE: int = 500
+ADMIN_DELETE_BATCH_SIZE: int = 500
+GC_MIN_AGE: int = 60 * 60
+WRITE_QUEUE_ENABLED: bool = True
+WRITE_BATCH_SIZE: int = 100
+WRITE_BATCH_DELAY: float = 0.005
+WRITE_TIMEOUT: int = 30
+SHARD_MOVE_BATCH_SIZE: int = 500
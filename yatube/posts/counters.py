@@ -0,0 +1,119 @@
+"""
+Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами в той же транзакции, что и сама запись,
+а recount_all пересчитывает их целиком набором UPDATE-запросов. С шардами
+число постов автора считается на его шарде: подзапрос из default видит
+только посты default.
+"""
+from collections import Counter
+from itertools import islice
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import sharding
+from .constants import TIMELINE_FANOUT_LIMIT
+from .models import AuthorStats, Comment, Follow, Post, User
+
+STATS_BATCH_SIZE = 500
+
+
+def _count_of(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def _author_counts():
+    """Подзапросы счётчиков для модели, чей pk — id пользователя."""
+    return {
+        'posts_count': _count_of(Post.objects.all(), 'author'),
+        'followers_count': _count_of(Follow.objects.all(), 'author'),
+        'following_count': _count_of(Follow.objects.all(), 'user'),
+    }
+
+
+def recount_author(user_id):
+    """Создаёт или пересчитывает строку счётчиков одного пользователя."""
+    counts = User.objects.filter(pk=user_id).annotate(
+        **_author_counts()
+    ).values('posts_count', 'followers_count', 'following_count').first()
+    if counts is None:
+        return
+    if sharding.enabled():
+        counts['posts_count'] = Post.objects.using(
+            sharding.shard_for_author(user_id)
+        ).filter(author_id=user_id).count()
+    AuthorStats.objects.update_or_create(user_id=user_id, defaults=counts)
+
+
+def add(user_id, field, delta):
+    updated = AuthorStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    if not updated and delta > 0:
+        recount_author(user_id)
+
+
+def add_comments(post_id, delta):
+    Post.objects.using(sharding.shard_for_post(post_id)).filter(
+        pk=post_id
+    ).update(comments_count=F('comments_count') + delta)
+
+
+def stats_for(user):
+    """Счётчики пользователя; нулевые, если он ещё ничего не делал."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return AuthorStats(user=user)
+
+
+def _recount_sharded_posts():
+    """Число постов авторов, сложенное по всем шардам."""
+    totals = Counter()
+    for alias in sharding.shards():
+        totals.update(dict(
+            Post.objects.using(alias).order_by().values_list(
+                'author'
+            ).annotate(total=Count('pk'))
+        ))
+    AuthorStats.objects.bulk_update(
+        [AuthorStats(user_id=user_id, posts_count=total)
+         for user_id, total in totals.items()],
+        ['posts_count'],
+        batch_size=STATS_BATCH_SIZE,
+    )
+
+
+def recount_all():
+    """Пересчитывает все счётчики с нуля."""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    ).iterator()
+    batch = list(islice(missing, STATS_BATCH_SIZE))
+    while batch:
+        AuthorStats.objects.bulk_create(
+            [AuthorStats(user_id=user_id) for user_id in batch],
+            ignore_conflicts=True,
+        )
+        batch = list(islice(missing, STATS_BATCH_SIZE))
+    AuthorStats.objects.update(**_author_counts())
+    # Обратно в «лёгкие» авторов переводит только timeline.refill.
+    AuthorStats.objects.filter(
+        followers_count__gt=TIMELINE_FANOUT_LIMIT
+    ).update(heavy=True)
+    if sharding.enabled():
+        _recount_sharded_posts()
+    for alias in sharding.every_shard():
+        Post.objects.using(alias).update(
+            comments_count=_count_of(Comment.objects.all(), 'post')
+        )
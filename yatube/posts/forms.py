@@ -1,5 +1,6 @@
 from django import forms
 
+from .constants import POST_IMAGE_MAX_BYTES, POST_IMAGE_MAX_PIXELS
 from .models import Comment, Post
 
 
@@ -13,6 +14,24 @@ class PostForm(forms.ModelForm):
             'image': 'Картинка к посту',
         }
 
+    def clean_image(self):
+        """Отсекает огромные картинки по заголовку, не распаковывая их."""
+        image = self.cleaned_data['image']
+        if not image or not hasattr(image, 'image'):
+            return image
+        if image.size > POST_IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                'Файл картинки слишком большой.', code='file_too_large'
+            )
+        width, height = image.image.size
+        if width * height > POST_IMAGE_MAX_PIXELS:
+            raise forms.ValidationError(
+                'Картинка слишком большая: не больше %(limit)s пикселей.',
+                code='too_many_pixels',
+                params={'limit': POST_IMAGE_MAX_PIXELS},
+            )
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
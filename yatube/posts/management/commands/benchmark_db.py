@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from posts.models import Post
+
+User = get_user_model()
+
+BENCHMARK_USERNAME = 'benchmark-db'
+# Не 127.0.0.1, чтобы в DEBUG не включалась панель отладки.
+CLIENT_OPTIONS = {'HTTP_HOST': 'localhost', 'REMOTE_ADDR': '192.0.2.1'}
+
+
+class BenchmarkClient(Client):
+    """
+    Client без перехвата исключений вьюх.
+
+    Обычный Client ловит их через общий сигнал got_request_exception и
+    поднимает ошибку чужого потока у всех клиентов сразу. Здесь ошибка
+    вьюхи остаётся ответом 500 того запроса, в котором она случилась.
+    """
+
+    def request(self, **request):
+        return self.handler(self._base_environ(**request))
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет пропускную способность чтения лент, пока другие потоки '
+        'создают посты и комментарии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help='Число потоков, читающих ленты.',
+        )
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=2,
+            help='Число потоков, создающих посты и комментарии.',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help='Длительность каждого замера в секундах.',
+        )
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        author, _ = User.objects.get_or_create(
+            username=f'{BENCHMARK_USERNAME}-author'
+        )
+        post = Post.objects.create(author=user, text='Пост для замера')
+        if settings.REPLICA_DATABASES:
+            call_command('sync_replicas', stdout=self.stdout)
+        read_urls = [
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ]
+        writes = [
+            (reverse('posts:create'), {'text': 'Пост из замера'}),
+            (reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+             {'text': 'Комментарий из замера'}),
+            (reverse('posts:profile_follow', kwargs={
+                'username': author.username
+            }), {}),
+            (reverse('posts:profile_unfollow', kwargs={
+                'username': author.username
+            }), {}),
+        ]
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            baseline = self._run(
+                user, read_urls, writes, options['readers'], 0,
+                options['duration'],
+            )
+            loaded = self._run(
+                user, read_urls, writes, options['readers'],
+                options['writers'], options['duration'],
+            )
+        finally:
+            request_logger.setLevel(level)
+            User.objects.filter(pk__in=[user.pk, author.pk]).delete()
+        self._report('Только чтение', baseline, options['duration'])
+        self._report('Чтение во время записи', loaded, options['duration'])
+
+    def _run(self, user, read_urls, writes, readers, writers, duration):
+        deadline = time.monotonic() + duration
+        result = {'reads': [], 'writes': [], 'counts': Counter()}
+        lock = threading.Lock()
+
+        def work(kind):
+            client = BenchmarkClient(**CLIENT_OPTIONS)
+            client.force_login(user)
+            requests = cycle(read_urls if kind == 'reads' else writes)
+            latency, counts = [], Counter()
+            try:
+                while time.monotonic() < deadline:
+                    request = next(requests)
+                    started = time.perf_counter()
+                    if kind == 'reads':
+                        response = client.get(request)
+                    else:
+                        response = client.post(*request)
+                    if response.status_code >= 500:
+                        counts['errors'] += 1
+                        continue
+                    latency.append(time.perf_counter() - started)
+                    counts[kind] += 1
+            finally:
+                connections.close_all()
+            with lock:
+                result[kind].extend(latency)
+                result['counts'].update(counts)
+
+        jobs = ['reads'] * readers + ['writes'] * writers
+        with ThreadPoolExecutor(len(jobs)) as pool:
+            for future in [pool.submit(work, kind) for kind in jobs]:
+                future.result()
+        return result
+
+    def _percentiles(self, latency):
+        latency = sorted(latency) or [0]
+        parts = []
+        for percent in (50, 95, 99):
+            index = max(len(latency) * percent // 100 - 1, 0)
+            parts.append(f'p{percent} {latency[index] * 1000:.1f} мс')
+        return ', '.join(parts)
+
+    def _report(self, title, result, duration):
+        counts = result['counts']
+        self.stdout.write(f'{title}, ошибок {counts["errors"]}:')
+        for kind, name in (('reads', 'чтений'), ('writes', 'записей')):
+            if counts[kind]:
+                self.stdout.write(
+                    f'  {name} {counts[kind] / duration:.1f}/с, '
+                    f'{self._percentiles(result[kind])}.'
+                )
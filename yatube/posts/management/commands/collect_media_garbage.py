@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+from posts.constants import GC_BATCH_SIZE, GC_MIN_AGE
+from posts.orphans import collect
+
+
+class Command(BaseCommand):
+    help = 'Удаляет картинки удалённых постов и ненужные миниатюры.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько файлов будет удалено.',
+        )
+        parser.add_argument(
+            '--quarantine',
+            help='Переносить файлы в этот каталог вместо удаления.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=GC_MIN_AGE,
+            help='Не трогать файлы моложе этого числа секунд.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=GC_BATCH_SIZE,
+            help='Сколько файлов проверять и удалять за раз.',
+        )
+
+    def handle(self, *args, **options):
+        report = collect(
+            dry_run=options['dry_run'],
+            quarantine=options['quarantine'],
+            min_age=options['min_age'],
+            batch_size=options['batch_size'],
+        )
+        if options['dry_run']:
+            action = 'Будет удалено'
+        elif options['quarantine']:
+            action = 'Перенесено в карантин'
+        else:
+            action = 'Удалено'
+        for kind, title in (('originals', 'картинок'),
+                            ('thumbnails', 'миниатюр')):
+            size = report[f'{kind}_bytes'] / 1024
+            self.stdout.write(
+                f'{action} {title}: {report[kind]} ({size:.1f} КБ).'
+            )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from posts.models import User
+from posts.sharding import enabled, move_author, rebalance, shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты автора и комментарии к ним на другой шард. Без '
+        'аргументов раскладывает по шардам всех авторов и закрепляет их '
+        'там; так делают после изменения DB_SHARDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', nargs='?', help='Автор.')
+        parser.add_argument('shard', nargs='?', help='Шард назначения.')
+
+    def handle(self, *args, **options):
+        if not enabled():
+            self.stdout.write('Шарды не настроены: задайте DB_SHARDS.')
+            return
+        username, shard = options['username'], options['shard']
+        if username is None:
+            moved = rebalance()
+        else:
+            if shard not in shards():
+                raise CommandError(
+                    f'Укажите шард из {", ".join(shards())}.'
+                )
+            author = User.objects.filter(username=username).first()
+            if author is None:
+                raise CommandError(f'Пользователь {username} не найден.')
+            moved = move_author(author.pk, shard)
+        self.stdout.write(self.style.SUCCESS(f'Перенесено постов: {moved}.'))
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import time
+
+from core.replicas import copy_database, mark_synced
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from posts.caching import REPLICA_FEED, bump
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в копии из REPLICA_DATABASES и '
+        'сбрасывает страницы, прочитанные со старых копий. Первый запуск '
+        'нужен до того, как вьюхи начнут читать с копий.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять каждые столько секунд; 0 — один раз.',
+        )
+
+    def handle(self, *args, **options):
+        replicas = settings.REPLICA_DATABASES
+        if not replicas:
+            self.stdout.write('Копии не настроены: задайте DB_REPLICAS.')
+            return
+        source = settings.DATABASES['default']['NAME']
+        while True:
+            started = time.monotonic()
+            synced = 0
+            for alias in replicas:
+                target = settings.DATABASES[alias]['NAME']
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                snapshot_started = time.time()
+                try:
+                    copy_database(source, target)
+                except sqlite3.OperationalError as error:
+                    # Копия без свежего снимка перестанет читаться через
+                    # REPLICA_MAX_LAG; следующий проход попробует снова.
+                    self.stderr.write(f'Копия {alias} не обновлена: {error}')
+                    continue
+                mark_synced(alias, snapshot_started)
+                synced += 1
+            bump(REPLICA_FEED)
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Копий обновлено: {synced} за {elapsed:.2f} с.'
+            ))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
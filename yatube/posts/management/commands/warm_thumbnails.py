@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from posts.caching import bump_all
+from posts.models import Post
+from posts.sharding import every_shard
+from posts.thumbnails import generate
+
+
+def _warm(post_id):
+    generate(post_id, bump_feeds=False)
+    return post_id
+
+
+class Command(BaseCommand):
+    help = 'Заранее строит миниатюры картинок всех постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов; 1 строит миниатюры в текущем.',
+        )
+
+    def handle(self, *args, **options):
+        post_ids = [
+            pk
+            for alias in every_shard()
+            for pk in Post.objects.using(alias).exclude(
+                image=''
+            ).values_list('pk', flat=True)
+        ]
+        if options['workers'] > 1:
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers']) as pool:
+                done = len(list(pool.map(_warm, post_ids, chunksize=16)))
+        else:
+            done = len(list(map(_warm, post_ids)))
+        bump_all()
+        self.stdout.write(self.style.SUCCESS(f'Миниатюр готово: {done}.'))
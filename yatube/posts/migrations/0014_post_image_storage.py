@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:11
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_search'),
+    ]
+
+    # Хранилище не меняет схему, а AlterField на SQLite пересоздал бы
+    # таблицу и вместе с ней удалил бы триггеры полнотекстового индекса.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='post',
+                    name='image',
+                    field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:40
+
+from importlib import import_module
+
+import django.utils.timezone
+from django.db import migrations, models
+
+search = import_module('posts.migrations.0013_post_search')
+
+# AddField и RemoveField на SQLite пересоздают таблицу постов и удаляют
+# триггеры полнотекстового индекса; они создаются заново после них.
+TRIGGERS = [
+    statement for statement in search.CREATE_INDEX
+    if 'CREATE TRIGGER' in statement
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            migrations.RunPython.noop, search._run(TRIGGERS)
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Изменён'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(
+            search._run(TRIGGERS), migrations.RunPython.noop
+        ),
+    ]
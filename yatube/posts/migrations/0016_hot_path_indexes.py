@@ -0,0 +1,76 @@
+# Generated by Django 2.2.28 on 2026-10-18 06:25
+
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def deduplicate_follows(apps, schema_editor):
+    """
+    Оставляет самую раннюю из одинаковых подписок и уменьшает счётчики.
+
+    Дубли находятся одним GROUP BY, а удаляются пачками по BATCH_SIZE пар.
+    """
+    db = schema_editor.connection.alias
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    duplicates = iter(list(
+        Follow.objects.using(db).values('user', 'author').annotate(
+            total=models.Count('pk'), keep=models.Min('pk')
+        ).filter(total__gt=1).order_by()
+    ))
+    batch = list(islice(duplicates, BATCH_SIZE))
+    while batch:
+        pairs = reduce(or_, (
+            models.Q(user_id=row['user'], author_id=row['author'])
+            for row in batch
+        ))
+        Follow.objects.using(db).filter(pairs).exclude(
+            pk__in=[row['keep'] for row in batch]
+        ).delete()
+        for row in batch:
+            extra = row['total'] - 1
+            AuthorStats.objects.using(db).filter(
+                user_id=row['user']
+            ).update(
+                following_count=models.F('following_count') - extra
+            )
+            AuthorStats.objects.using(db).filter(
+                user_id=row['author']
+            ).update(
+                followers_count=models.F('followers_count') - extra
+            )
+        batch = list(islice(duplicates, BATCH_SIZE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date_idx'),
+        ),
+        migrations.RunPython(
+            deduplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='follow_unique_user_author'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_sharding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Ключ комментария',
+                'verbose_name_plural': 'Ключи комментариев',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+# Значение TIMELINE_FANOUT_LIMIT на момент миграции.
+FANOUT_LIMIT = 1000
+
+
+def mark_heavy(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.using(schema_editor.connection.alias).filter(
+        followers_count__gt=FANOUT_LIMIT
+    ).update(heavy=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_commentkey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='heavy',
+            field=models.BooleanField(default=False, verbose_name='Посты не раскладываются по лентам'),
+        ),
+        migrations.RunPython(mark_heavy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,234 @@
+"""
+Сборка мусора в media: картинки удалённых постов и их миниатюры.
+
+Каталоги обходятся потоково и пачками по GC_BATCH_SIZE файлов: для
+картинок каждая пачка сверяется с Post.image одним запросом на шард
+(posts.sharding). Миниатюра жива, если она — вариант картинки живого
+поста (posts.thumbnails) или записана в хранилище ключей sorl за такой
+картинкой; их имена собираются во временную базу SQLite на диске, а не
+в память, и пачка сверяется с ней одним запросом.
+
+Файлы моложе min_age не трогаются: их пост мог ещё не зафиксироваться.
+Повторная загрузка того же файла обновляет его mtime
+(core.storage), поэтому перед удалением сирота отводится под временное
+имя и проверяется ещё раз: тронутую или снова нужную посту возвращают.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections import Counter
+from contextlib import closing, contextmanager
+from functools import partial
+from itertools import chain, islice
+
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from .constants import GC_BATCH_SIZE, GC_MIN_AGE
+from .models import Post
+from .sharding import every_shard
+from .thumbnails import thumbnail_file, variants
+
+GC_SUFFIX = '.gc'
+
+
+def _image_field_file(name):
+    field = Post._meta.get_field('image')
+    return field.attr_class(None, field, name)
+
+
+def scan(root, min_age=GC_MIN_AGE):
+    """Файлы под root: (путь от root через '/', полный путь, размер)."""
+    if not os.path.isdir(root):
+        return
+    oldest = time.time() - min_age
+    directories = [root]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime > oldest:
+                        continue
+                    name = os.path.relpath(entry.path, root)
+                    name = name.replace(os.sep, '/')
+                    yield name, entry.path, stat.st_size
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def _registered_thumbnails(sources):
+    """Имена миниатюр, записанных в хранилище sorl за картинками sources."""
+    lists = KVStore.objects.filter(
+        key__in=[add_prefix(source.key, 'thumbnails') for source in sources]
+    ).values_list('value', flat=True)
+    keys = [add_prefix(key) for value in lists for key in deserialize(value)]
+    values = KVStore.objects.filter(key__in=keys).values_list(
+        'value', flat=True
+    )
+    return {deserialize_image_file(value).name for value in values}
+
+
+@contextmanager
+def live_thumbnails(batch_size=GC_BATCH_SIZE):
+    """Временная база с именами миниатюр, нужных картинкам живых постов."""
+    names = chain.from_iterable(
+        Post.objects.using(alias).exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct().iterator()
+        for alias in every_shard()
+    )
+    # Пустое имя — временная база SQLite, которая удаляется при закрытии.
+    with closing(sqlite3.connect('')) as live:
+        live.execute('CREATE TABLE live (name TEXT PRIMARY KEY)')
+        for batch in _batches(names, batch_size):
+            images = [_image_field_file(name) for name in batch]
+            thumbnails = {
+                thumbnail_file(image, *variant).name
+                for image in images
+                for variant in variants()
+            }
+            thumbnails.update(
+                _registered_thumbnails([ImageFile(image) for image in images])
+            )
+            live.executemany(
+                'INSERT OR IGNORE INTO live VALUES (?)',
+                ((name,) for name in thumbnails),
+            )
+        live.commit()
+        yield live
+
+
+def _live_names(live, names):
+    """Те из names, что есть во временной базе live_thumbnails."""
+    rows = live.execute(
+        'SELECT value FROM json_each(?) '
+        'WHERE value IN (SELECT name FROM live)',
+        [json.dumps(names)],
+    )
+    return {name for name, in rows}
+
+
+def _forget(keys):
+    KVStore.objects.filter(key__in=keys).delete()
+    default.kvstore.cache.delete_many(keys)
+
+
+def _aside(path):
+    return f'{path}{GC_SUFFIX}'
+
+
+def _take(files, oldest):
+    """
+    Отводит файлы под временные имена, пропуская тронутые после обхода.
+
+    Загрузка, которая успела обновить mtime, файл сохраняет; загрузка
+    после переименования не найдёт его и запишет заново.
+    """
+    taken = []
+    for file in files:
+        path = file[1]
+        try:
+            os.rename(path, _aside(path))
+        except FileNotFoundError:
+            continue
+        if os.stat(_aside(path)).st_mtime > oldest:
+            os.replace(_aside(path), path)
+            continue
+        taken.append(file)
+    return taken
+
+
+def _restore(files):
+    for _, path, _ in files:
+        os.replace(_aside(path), path)
+
+
+def _remove(files, root, quarantine):
+    for name, path, _ in files:
+        if quarantine is None:
+            os.remove(_aside(path))
+            continue
+        target = os.path.join(quarantine, root, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(_aside(path), target)
+
+
+def _orphan_originals(batch, upload_to):
+    """Картинки пачки, на которые не ссылается ни один пост."""
+    names = [f'{upload_to}/{name}' for name, _, _ in batch]
+    referenced = set()
+    for alias in every_shard():
+        referenced.update(
+            Post.objects.using(alias).filter(
+                image__in=names
+            ).values_list('image', flat=True)
+        )
+    orphans, keys = [], []
+    for name, file in zip(names, batch):
+        if name in referenced:
+            continue
+        source = ImageFile(_image_field_file(name))
+        orphans.append(file)
+        keys += [add_prefix(source.key), add_prefix(source.key, 'thumbnails')]
+    return orphans, keys
+
+
+def _orphan_thumbnails(batch, prefix, live):
+    """Миниатюры пачки, которых нет среди нужных живым постам."""
+    found = _live_names(live, [f'{prefix}/{name}' for name, _, _ in batch])
+    orphans = [file for file in batch if f'{prefix}/{file[0]}' not in found]
+    keys = [
+        add_prefix(ImageFile(f'{prefix}/{name}', default.storage).key)
+        for name, _, _ in orphans
+    ]
+    return orphans, keys
+
+
+def collect(dry_run=False, quarantine=None, min_age=GC_MIN_AGE,
+            batch_size=GC_BATCH_SIZE):
+    """
+    Удаляет или переносит в quarantine осиротевшие файлы media.
+
+    Возвращает Counter с числом и объёмом найденных сирот по видам:
+    originals — картинки постов, thumbnails — миниатюры sorl.
+    """
+    field = Post._meta.get_field('image')
+    upload_to = field.upload_to.strip('/')
+    prefix = thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+    oldest = time.time() - min_age
+    report = Counter()
+    with live_thumbnails(batch_size) as live:
+        sources = [
+            ('originals', upload_to, field.storage,
+             partial(_orphan_originals, upload_to=upload_to)),
+            ('thumbnails', prefix, default.storage,
+             partial(_orphan_thumbnails, prefix=prefix, live=live)),
+        ]
+        for kind, root, storage, orphans_of in sources:
+            files = scan(storage.path(root), min_age)
+            for batch in _batches(files, batch_size):
+                orphans, keys = orphans_of(batch)
+                if not dry_run and orphans:
+                    taken = _take(orphans, oldest)
+                    orphans, keys = orphans_of(taken)
+                    _restore(set(taken) - set(orphans))
+                    _remove(orphans, root, quarantine)
+                    _forget(keys)
+                report[kind] += len(orphans)
+                report[f'{kind}_bytes'] += sum(size for _, _, size in orphans)
+    return report
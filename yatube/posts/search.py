@@ -0,0 +1,133 @@
+"""
+Полнотекстовый поиск по Post.text через SQLite FTS5.
+
+Индекс posts_post_fts (миграция 0013) синхронизируется триггерами,
+поэтому его не обходят ни queryset.update, ни удаление каскадом.
+Выдача ранжируется по bm25 и листается курсором (ранг, id), а горячие
+запросы отдаются из кеша, который сбрасывается с поколением общей ленты.
+С шардами у каждого свой индекс, и выдачи шардов сливаются по (ранг, id);
+bm25 считает частоты слов по индексу своего шарда.
+"""
+import base64
+import binascii
+import hashlib
+import heapq
+import re
+from itertools import islice
+
+from core.caching.coalescing import get_or_build
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .caching import feed_key
+from .constants import (SEARCH_CACHE_TIMEOUT, SEARCH_MAX_TERMS,
+                        SEARCH_RESULTS_PER_PAGE)
+from .models import Post
+from .sharding import across_shards, shards
+
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# Ранг и LIMIT считаются во внутреннем запросе, а snippet — только для
+# строк страницы: иначе SQLite строил бы фрагмент каждого совпадения.
+# CROSS JOIN фиксирует порядок: страница, затем поиск в индексе по rowid.
+SEARCH_SQL = f"""
+    SELECT page.rowid, page.score, snippet(
+        posts_post_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16
+    )
+    FROM (
+        SELECT rowid, score FROM (
+            SELECT rowid, bm25(posts_post_fts) AS score
+            FROM posts_post_fts
+            WHERE posts_post_fts MATCH %s
+        )
+        WHERE score > %s OR (score = %s AND rowid > %s)
+        ORDER BY score, rowid
+        LIMIT %s
+    ) AS page
+    CROSS JOIN posts_post_fts ON posts_post_fts.rowid = page.rowid
+    WHERE posts_post_fts MATCH %s
+    ORDER BY page.score, page.rowid
+"""
+
+
+def match_expression(query):
+    """Запрос пользователя как FTS5-выражение: все слова, в кавычках."""
+    terms = re.findall(r'\w+', query)[:SEARCH_MAX_TERMS]
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def encode_cursor(score, post_id):
+    raw = f'{score!r}|{post_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        score, post_id = base64.urlsafe_b64decode(
+            padded.encode()
+        ).decode().split('|')
+        return float(score), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def highlight(fragment):
+    return mark_safe(
+        escape(fragment)
+        .replace(HIGHLIGHT_START, '<mark>')
+        .replace(HIGHLIGHT_END, '</mark>')
+    )
+
+
+def _find_on(alias, expression, after, limit):
+    score, post_id = after
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            SEARCH_SQL,
+            [expression, score, score, post_id, limit, expression],
+        )
+        return cursor.fetchall()
+
+
+def _find(expression, after, limit):
+    streams = [
+        _find_on(alias, expression, after, limit)
+        for alias in shards() or [DEFAULT_DB_ALIAS]
+    ]
+    merged = heapq.merge(*streams, key=lambda row: (row[1], row[0]))
+    return list(islice(merged, limit))
+
+
+def search_posts(query, cursor=None, per_page=SEARCH_RESULTS_PER_PAGE):
+    """
+    Посты, подходящие под запрос, и курсор следующей страницы.
+
+    У каждого поста есть атрибут snippet с подсвеченным фрагментом.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return [], None
+    after = (cursor and decode_cursor(cursor)) or (float('-inf'), 0)
+    digest = hashlib.md5(f'{expression}|{after}'.encode()).hexdigest()
+    rows = get_or_build(
+        f'posts:search:{feed_key("index")}:{digest}',
+        lambda: _find(expression, after, per_page + 1),
+        SEARCH_CACHE_TIMEOUT,
+    )
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    posts = across_shards(Post.objects.all()).select_related(
+        'author', 'group'
+    ).in_bulk([post_id for post_id, _, _ in rows])
+    results = []
+    for post_id, _, fragment in rows:
+        post = posts.get(post_id)
+        if post is not None:
+            post.snippet = highlight(fragment)
+            results.append(post)
+    return results, next_cursor
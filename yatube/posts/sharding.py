@@ -0,0 +1,538 @@
+"""
+Посты и комментарии на нескольких базах, разложенные по авторам.
+
+Посты автора и комментарии к ним лежат на одном шарде из
+SHARD_DATABASES, поэтому профиль, страница поста и её комментарии
+читаются с одной базы. Первый шард — сама default, так что посты,
+записанные до включения шардов, остаются на месте. Пользователи,
+группы, подписки и ленты живут в default; связи постов с ними база не
+проверяет (миграция 0017), а select_related к ним заменяется на
+prefetch_related.
+
+Шард автора записывается в AuthorShard при его первом посте, а до
+того выбирается по остатку от id. id постов выдаёт каталог PostKey в
+default: они не пересекаются между шардами и не меняются при переносе,
+и по ним страница поста находит шард. Так же id комментариев выдаёт
+каталог CommentKey. Посты и комментарии надо создавать через save или
+create: bulk_create мимо каталога выдаст id, которые могут совпасть с
+чужими.
+
+Главная, группа, подписки и поиск собираются из отсортированных выборок
+шардов k-путевым слиянием (ShardedQuerySet). Материализованная лента
+подписок при шардах не ведётся. Админка показывает посты одного шарда
+за раз. Автора между шардами переносит команда rebalance_shards; после
+изменения DB_SHARDS её запускают без аргументов.
+
+Без DB_SHARDS шардов нет: роутер ни во что не вмешивается, а функции
+отсюда возвращают None вместо псевдонима, то есть .using(None) —
+«базу выбирает роутер», как раньше.
+"""
+import heapq
+import threading
+from contextlib import contextmanager
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from .caching import bump
+from .constants import SHARD_MOVE_BATCH_SIZE
+from .models import (AuthorShard, Comment, CommentKey, Post, PostKey,
+                     TimelineEntry, User)
+
+SHARD_CACHE_PREFIX = 'posts:shard'
+
+_state = threading.local()
+
+
+def shards():
+    """Псевдонимы шардов; пустой список, если шардирование выключено."""
+    return list(settings.SHARD_DATABASES)
+
+
+def enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+def every_shard():
+    """Базы для обхода всех постов; без шардов — [None], то есть роутер."""
+    return shards() or [None]
+
+
+def other_shards(using):
+    """Шарды, кроме using."""
+    return [alias for alias in shards() if alias != using]
+
+
+def _author_key(author_id):
+    return f'{SHARD_CACHE_PREFIX}:author:{author_id}'
+
+
+def _post_key(post_id):
+    return f'{SHARD_CACHE_PREFIX}:post:{post_id}'
+
+
+def shards_for_authors(author_ids):
+    """Шард каждого из авторов: {id автора: псевдоним}."""
+    keys = {_author_key(author_id): author_id for author_id in author_ids}
+    found = {
+        keys[key]: alias for key, alias in cache.get_many(keys).items()
+    }
+    missing = [author_id for author_id in keys.values()
+               if author_id not in found]
+    if missing:
+        pinned = dict(
+            AuthorShard.objects.using(DEFAULT_DB_ALIAS).filter(
+                user_id__in=missing
+            ).values_list('user_id', 'database')
+        )
+        cache.set_many(
+            {_author_key(author_id): alias
+             for author_id, alias in pinned.items()},
+            None,
+        )
+        found.update(pinned)
+        aliases = shards()
+        for author_id in missing:
+            found.setdefault(author_id, aliases[author_id % len(aliases)])
+    return found
+
+
+def shard_for_author(author_id):
+    """Шард постов автора или None без шардов."""
+    if not enabled():
+        return None
+    return shards_for_authors([author_id])[author_id]
+
+
+def shard_for_post(post_id):
+    """Шард поста по каталогу; посты не из каталога лежат в default."""
+    if not enabled():
+        return None
+    author_id = cache.get(_post_key(post_id))
+    if author_id is None:
+        author_id = PostKey.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk=post_id
+        ).values_list('author_id', flat=True).first()
+        if author_id is None:
+            return DEFAULT_DB_ALIAS
+        cache.set(_post_key(post_id), author_id, None)
+    return shard_for_author(author_id)
+
+
+def pin_author(author_id, alias):
+    """Закрепляет автора за шардом alias."""
+    AuthorShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=author_id, defaults={'database': alias}
+    )
+    cache.set(_author_key(author_id), alias, None)
+
+
+def place_post(post, using):
+    """Выдаёт новому посту id из каталога и закрепляет автора за using."""
+    if not enabled() or post.pk is not None:
+        return
+    post.pk = PostKey.objects.using(DEFAULT_DB_ALIAS).create(
+        author_id=post.author_id
+    ).pk
+    cache.set(_post_key(post.pk), post.author_id, None)
+    if cache.get(_author_key(post.author_id)) is None:
+        shard, _ = AuthorShard.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+            user_id=post.author_id, defaults={'database': using}
+        )
+        cache.set(_author_key(post.author_id), shard.database, None)
+
+
+def place_comment(comment):
+    """Выдаёт новому комментарию id из каталога."""
+    if enabled() and comment.pk is None:
+        comment.pk = CommentKey.objects.using(DEFAULT_DB_ALIAS).create().pk
+
+
+def is_moving():
+    """Идёт ли в этом потоке перенос постов между шардами."""
+    return getattr(_state, 'moving', False)
+
+
+@contextmanager
+def moving():
+    """
+    Удаления внутри — перенос: посты и комментарии уже лежат на другом
+    шарде, поэтому сигналы не трогают счётчики и ленты.
+    """
+    previous, _state.moving = is_moving(), True
+    try:
+        yield
+    finally:
+        _state.moving = previous
+
+
+class ShardRouter:
+    """Посты и комментарии — на шард автора поста, остальное — дальше."""
+
+    def _shard(self, model, instance):
+        if model not in (Post, Comment) or not enabled():
+            return None
+        if isinstance(instance, Post) and instance.author_id is not None:
+            return shard_for_author(instance.author_id)
+        if isinstance(instance, Comment):
+            return instance._state.db or shard_for_post(instance.post_id)
+        if isinstance(instance, User) and model is Post:
+            return shard_for_author(instance.pk)
+        if isinstance(instance, TimelineEntry):
+            return shard_for_post(instance.post_id)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not enabled():
+            return None
+        databases = {
+            DEFAULT_DB_ALIAS, *shards(), *settings.REPLICA_DATABASES
+        }
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+def _sort_key(obj, names):
+    return tuple(getattr(obj, name) for name in names)
+
+
+def _beyond(names, key, descending, inclusive=False):
+    """Условие на строки, которые идут после key в порядке names."""
+    lookup = 'lt' if descending else 'gt'
+    conditions = [
+        Q(**dict(zip(names[:position], key)),
+          **{f'{names[position]}__{lookup}': key[position]})
+        for position in range(len(names))
+    ]
+    if inclusive:
+        conditions.append(Q(**dict(zip(names, key))))
+    return reduce(or_, conditions)
+
+
+class ShardedQuerySet:
+    """
+    Выборка сразу с нескольких шардов.
+
+    filter, order_by и подобные применяются к выборке каждого шарда, а
+    срез и перебор сливают их кучей по ordering: с каждого шарда
+    читается не больше строк, чем нужно до конца среза. select_related
+    превращается в prefetch_related — связанные строки лежат в default.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        self.model = self.querysets[0].model
+
+    def __repr__(self):
+        return f'<ShardedQuerySet of {len(self.querysets)} shards>'
+
+    def _chain(self, method, *args, **kwargs):
+        return ShardedQuerySet(
+            getattr(queryset, method)(*args, **kwargs)
+            for queryset in self.querysets
+        )
+
+    def all(self):
+        return self._chain('all')
+
+    def filter(self, *args, **kwargs):
+        return self._chain('filter', *args, **kwargs)
+
+    def exclude(self, *args, **kwargs):
+        return self._chain('exclude', *args, **kwargs)
+
+    def order_by(self, *fields):
+        return self._chain('order_by', *fields)
+
+    def prefetch_related(self, *lookups):
+        return self._chain('prefetch_related', *lookups)
+
+    def select_related(self, *fields):
+        return self._chain('prefetch_related', *fields)
+
+    @property
+    def ordered(self):
+        return all(queryset.ordered for queryset in self.querysets)
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def exists(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def in_bulk(self, id_list):
+        found = {}
+        for queryset in self.querysets:
+            found.update(queryset.in_bulk(id_list))
+        return found
+
+    def _ordering(self):
+        """Поля сортировки и её направление."""
+        query = self.querysets[0].query
+        ordering = query.order_by or self.model._meta.ordering
+        descending = {name.startswith('-') for name in ordering}
+        if len(descending) != 1:
+            raise ValueError(
+                'Слияние шардов требует ordering в одну сторону.'
+            )
+        return [name.lstrip('-') for name in ordering], descending.pop()
+
+    def _merged(self, stop=None, querysets=None):
+        names, descending = self._ordering()
+        streams = [
+            queryset if stop is None else queryset[:stop]
+            for queryset in querysets or self.querysets
+        ]
+        return heapq.merge(
+            *streams,
+            key=lambda obj: _sort_key(obj, names),
+            reverse=descending,
+        )
+
+    def _page(self, start, stop):
+        """
+        Срез со смещением без чтения start строк с каждого шарда.
+
+        Каждый шард отдаёт строку номер start // k; самая ранняя из них
+        — граница. Её номер в общей выборке — сумма строк шардов до неё,
+        а их на шарде считает COUNT по диапазону между границей и его
+        строкой. Сливаются только строки от границы: при ровном
+        раскладе — около stop - start с шарда, при перекосе — больше,
+        но не больше прежнего stop.
+        """
+        names, descending = self._ordering()
+        if names[-1] not in ('pk', 'id'):
+            # Без уникального последнего поля позиция границы неоднозначна.
+            return list(islice(self._merged(stop), start, stop))
+        offset = start // len(self.querysets)
+        heads = [
+            queryset[offset:offset + 1] for queryset in self.querysets
+        ]
+        keys = [_sort_key(head[0], names) for head in heads if head]
+        if not keys:
+            return list(islice(self._merged(stop), start, stop))
+        boundary = max(keys) if descending else min(keys)
+        from_boundary = _beyond(names, boundary, descending, inclusive=True)
+        before = 0
+        for queryset, head in zip(self.querysets, heads):
+            if not head:
+                before += queryset.exclude(from_boundary).count()
+                continue
+            head_key = _sort_key(head[0], names)
+            before += offset - queryset.filter(
+                from_boundary, _beyond(names, head_key, not descending)
+            ).count()
+        skip, limit = start - before, stop - start
+        tails = [queryset.filter(from_boundary) for queryset in self.querysets]
+        return list(islice(
+            self._merged(skip + limit, tails), skip, skip + limit
+        ))
+
+    def __iter__(self):
+        return self._merged()
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            if k.step is not None:
+                raise ValueError('Шаг среза не поддерживается.')
+            start = k.start or 0
+            if start and k.stop is not None and len(self.querysets) > 1:
+                return self._page(start, k.stop)
+            return list(islice(self._merged(k.stop), start, k.stop))
+        found = list(islice(self._merged(k + 1), k, k + 1))
+        if not found:
+            raise IndexError(k)
+        return found[0]
+
+
+def across_shards(queryset):
+    """queryset на всех шардах сразу; без шардов — он сам."""
+    if not enabled():
+        return queryset
+    return ShardedQuerySet(queryset.using(alias) for alias in shards())
+
+
+def posts_by_authors(author_ids):
+    """Посты авторов: по выборке с каждого шарда, где они лежат."""
+    grouped = {}
+    for author_id, alias in shards_for_authors(author_ids).items():
+        grouped.setdefault(alias, []).append(author_id)
+    if not grouped:
+        return Post.objects.none()
+    return ShardedQuerySet(
+        Post.objects.using(alias).filter(author_id__in=ids)
+        for alias, ids in grouped.items()
+    )
+
+
+def related(queryset, *fields):
+    """select_related на одной базе, prefetch_related при шардах."""
+    if enabled():
+        return queryset.prefetch_related(*fields)
+    return queryset.select_related(*fields)
+
+
+def _copy_rows(model, objs, fields, using):
+    """Вставляет строки как есть, без auto_now и сигналов."""
+    if not objs:
+        return
+    size = connections[using].ops.bulk_batch_size(fields, objs)
+    manager = model._base_manager.using(using)
+    for start in range(0, len(objs), size):
+        manager._insert(objs[start:start + size], fields=fields, raw=True)
+
+
+def _move_batch(post_ids, source, target):
+    """Копирует на target посты пачки, которых там ещё нет, с комментариями."""
+    present = set(
+        Post.objects.using(target).filter(
+            pk__in=post_ids
+        ).values_list('pk', flat=True)
+    )
+    missing = [pk for pk in post_ids if pk not in present]
+    if not missing:
+        return
+    _copy_rows(
+        Post,
+        list(Post.objects.using(source).filter(pk__in=missing)),
+        Post._meta.local_concrete_fields,
+        target,
+    )
+    _copy_rows(
+        Comment,
+        list(Comment.objects.using(source).filter(post_id__in=missing)),
+        Comment._meta.local_concrete_fields,
+        target,
+    )
+
+
+def _batches(items):
+    items = iter(items)
+    batch = list(islice(items, SHARD_MOVE_BATCH_SIZE))
+    while batch:
+        yield batch
+        batch = list(islice(items, SHARD_MOVE_BATCH_SIZE))
+
+
+def move_author(author_id, target):
+    """
+    Переносит посты автора и комментарии к ним на шард target.
+
+    Исходный шард держит блокировку записи (BEGIN IMMEDIATE) до конца
+    прохода, поэтому записи туда ждут его, а не теряются. id постов и
+    комментариев сохраняются: их выдают общие каталоги. Копии
+    удаляются обычным delete под moving(), так что каскады
+    отрабатывают, а счётчики и ленты остаются как есть. Посты, которые
+    прерванный запуск уже скопировал, пропускаются, так что перенос
+    можно повторить.
+
+    Вставка, которая выбрала шард до закрепления автора, могла дождаться
+    блокировки и записать пост на исходный шард уже после прохода.
+    Поэтому проходы повторяются, пока исходный шард не опустеет, а
+    вставку, которая опоздала и к последнему проходу, досылает
+    settle_post. Возвращает число перенесённых постов.
+    """
+    moved = []
+    for source in other_shards(target):
+        post_ids = _move_pass(author_id, source, target)
+        while post_ids:
+            moved.extend(post_ids)
+            post_ids = _move_pass(author_id, source, target)
+    pin_author(author_id, target)
+    bump(('profile', author_id), *[('post', pk) for pk in moved])
+    return len(moved)
+
+
+def _move_pass(author_id, source, target):
+    """Один проход переноса с source; возвращает id перенесённых постов."""
+    with transaction.atomic(using=source):
+        post_ids = list(
+            Post.objects.using(source).filter(
+                author_id=author_id
+            ).order_by('pk').values_list('pk', flat=True)
+        )
+        if not post_ids:
+            return post_ids
+        with transaction.atomic(using=target):
+            for batch in _batches(post_ids):
+                PostKey.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+                    [PostKey(pk=pk, author_id=author_id) for pk in batch],
+                    ignore_conflicts=True,
+                )
+                _move_batch(batch, source, target)
+        pin_author(author_id, target)
+        with moving():
+            for batch in _batches(post_ids):
+                Post.objects.using(source).filter(pk__in=batch).delete()
+    return post_ids
+
+
+def settle_post(post, using):
+    """
+    Досылает новый пост на шард автора, если пока вставка ждала
+    блокировку, перенос закрепил автора за другим шардом.
+    """
+    if not enabled():
+        return
+    alias = shard_for_author(post.author_id)
+    if alias != using:
+        move_author(post.author_id, alias)
+        post._state.db = alias
+
+
+def register_posts(alias):
+    """Заносит в каталог посты шарда, записанные до включения шардов."""
+    rows = Post.objects.using(alias).order_by().values_list(
+        'pk', 'author_id'
+    ).iterator()
+    for batch in _batches(rows):
+        PostKey.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [PostKey(pk=pk, author_id=author_id) for pk, author_id in batch],
+            ignore_conflicts=True,
+        )
+
+
+def register_comments(alias):
+    """Заносит в каталог комментарии шарда, записанные до включения шардов."""
+    ids = Comment.objects.using(alias).order_by().values_list(
+        'pk', flat=True
+    ).iterator()
+    for batch in _batches(ids):
+        CommentKey.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+            [CommentKey(pk=pk) for pk in batch], ignore_conflicts=True
+        )
+
+
+def rebalance():
+    """
+    Раскладывает всех авторов по их шардам и закрепляет их там.
+
+    Закреплённый автор переезжает на свой шард, остальные — на шард по
+    остатку от id. Возвращает число перенесённых постов.
+    """
+    authors = set()
+    for alias in shards():
+        register_posts(alias)
+        register_comments(alias)
+        authors.update(
+            Post.objects.using(alias).order_by().values_list(
+                'author_id', flat=True
+            ).distinct()
+        )
+    placement = shards_for_authors(sorted(authors))
+    return sum(
+        move_author(author_id, placement[author_id])
+        for author_id in sorted(authors)
+    )
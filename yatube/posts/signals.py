@@ -0,0 +1,143 @@
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import counters, sharding, thumbnails, timeline
+from .caching import ALL_FEEDS, bump_on_commit, post_feeds
+from .models import Comment, Follow, Group, Post, User
+
+# Поля, которые видны в карточках постов (posts.cards) на всех лентах.
+CARD_FIELDS = {
+    User: ('username', 'first_name', 'last_name'),
+    Group: ('slug', 'title'),
+}
+
+
+def _follow_feeds(follow):
+    return [
+        ('follow', follow.user_id),
+        ('stats', follow.user_id),
+        ('stats', follow.author_id),
+    ]
+
+
+@receiver(post_init, sender=Post)
+def remember_initial(sender, instance, **kwargs):
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = instance.image.name
+
+
+@receiver(pre_save, sender=Post)
+def post_placed(sender, instance, using, raw, **kwargs):
+    if not raw:
+        sharding.place_post(instance, using)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, using, **kwargs):
+    if created:
+        sharding.settle_post(instance, using)
+        counters.add(instance.author_id, 'posts_count', 1)
+        followers = timeline.fan_out(instance)
+    else:
+        followers = timeline.light_followers(instance.author_id)
+    bump_on_commit(*post_feeds(instance, followers), using=using)
+    if instance.image and instance.image.name != instance._initial_image:
+        thumbnails.schedule(instance.pk)
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = instance.image.name
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, using, **kwargs):
+    if sharding.is_moving():
+        return
+    timeline.forget(instance, using)
+    counters.add(instance.author_id, 'posts_count', -1)
+    followers = timeline.light_followers(instance.author_id)
+    bump_on_commit(*post_feeds(instance, followers), using=using)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_placed(sender, instance, raw, **kwargs):
+    if not raw:
+        sharding.place_comment(instance)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, using, **kwargs):
+    if created:
+        counters.add_comments(instance.post_id, 1)
+    bump_on_commit(('post', instance.post_id), using=using)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, using, **kwargs):
+    if sharding.is_moving():
+        return
+    counters.add_comments(instance.post_id, -1)
+    bump_on_commit(('post', instance.post_id), using=using)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, using, **kwargs):
+    if created:
+        counters.add(instance.author_id, 'followers_count', 1)
+        counters.add(instance.user_id, 'following_count', 1)
+        timeline.followers_changed(instance.author_id)
+        timeline.backfill(instance)
+    bump_on_commit(*_follow_feeds(instance), using=using)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, using, **kwargs):
+    counters.add(instance.author_id, 'followers_count', -1)
+    counters.add(instance.user_id, 'following_count', -1)
+    timeline.prune(instance)
+    timeline.followers_changed(instance.author_id)
+    bump_on_commit(*_follow_feeds(instance), using=using)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Group)
+def card_fields_saving(sender, instance, update_fields, **kwargs):
+    fields = CARD_FIELDS[sender]
+    instance._card_fields_changed = False
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    saved = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+    instance._card_fields_changed = saved not in (
+        None, tuple(getattr(instance, field) for field in fields)
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, using, **kwargs):
+    # Имя автора в закешированных карточках и лентах; вход в систему
+    # (update_fields=['last_login']) сюда не доходит.
+    if instance._card_fields_changed:
+        bump_on_commit(ALL_FEEDS, using=using)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, using, **kwargs):
+    bump_on_commit(('group', instance.pk), using=using)
+    if instance._card_fields_changed:
+        bump_on_commit(ALL_FEEDS, using=using)
+
+
+# Каскады Django удаляют связанные строки только на базе самого объекта;
+# посты и комментарии на остальных шардах обрабатываются здесь.
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, using, **kwargs):
+    for alias in sharding.other_shards(using):
+        Comment.objects.using(alias).filter(author=instance).delete()
+        Post.objects.using(alias).filter(author=instance).delete()
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, using, **kwargs):
+    for alias in sharding.other_shards(using):
+        Post.objects.using(alias).filter(group=instance).update(group=None)
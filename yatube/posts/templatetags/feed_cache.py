@@ -0,0 +1,68 @@
+from core.caching.coalescing import get_or_build
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from ..cards import render_cards
+from ..constants import FEED_CACHE_TIMEOUT
+
+register = template.Library()
+
+
+def page_key(page_obj):
+    """Номер страницы или курсор, по которому она была запрошена."""
+    if getattr(page_obj, 'is_cursor', False):
+        return f'cursor:{page_obj.cursor}'
+    return page_obj.number
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, feed_key, page_obj=None):
+        self.nodelist = nodelist
+        self.feed_key = feed_key
+        self.page_obj = page_obj
+
+    def render(self, context):
+        vary_on = [self.feed_key.resolve(context)]
+        if self.page_obj is not None:
+            vary_on.append(page_key(self.page_obj.resolve(context)))
+        cache_key = make_template_fragment_key('posts_feed', vary_on)
+        return get_or_build(
+            cache_key,
+            lambda: self.nodelist.render(context),
+            FEED_CACHE_TIMEOUT,
+        )
+
+
+@register.tag
+def feedcache(parser, token):
+    """
+    Кеширует общую для всех пользователей часть ленты.
+
+    Использование::
+
+        {% feedcache feed_key page_obj %}...{% endfeedcache %}
+
+    feed_key строится через posts.caching.feed_key и меняется вместе
+    с поколением ленты, поэтому TTL может быть долгим. page_obj можно
+    опустить для фрагментов без пагинации. Промах пересобирает один
+    воркер, остальные ждут его или отдают устаревшую копию.
+
+    Всё, что зависит от пользователя (шапка, переключатель лент,
+    кнопка подписки), остаётся снаружи и рендерится на каждый запрос.
+    """
+    bits = token.split_contents()
+    if len(bits) not in (2, 3):
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает ключ ленты и, необязательно, page_obj'
+        )
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    return FeedCacheNode(
+        nodelist, *(parser.compile_filter(bit) for bit in bits[1:])
+    )
+
+
+@register.simple_tag
+def page_cards(posts, thumbnails):
+    """Карточки постов страницы из общего кеша одним get_many."""
+    return render_cards(posts, thumbnails)
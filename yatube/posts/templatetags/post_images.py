@@ -0,0 +1,23 @@
+from django import template
+
+from ..thumbnails import ready_thumbnail, ready_thumbnails, schedule
+
+register = template.Library()
+
+
+@register.simple_tag
+def page_thumbnails(posts):
+    """Готовые миниатюры всех постов страницы одним запросом."""
+    return ready_thumbnails(posts)
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post, thumbnails=None):
+    """Миниатюра поста или заглушка, пока миниатюра строится в фоне."""
+    if thumbnails is None:
+        thumbnail = ready_thumbnail(post)
+    else:
+        thumbnail = thumbnails.get(post.pk)
+    if post.image and thumbnail is None:
+        schedule(post.pk)
+    return {'post': post, 'thumbnail': thumbnail}
@@ -0,0 +1,81 @@
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..caching import versions
+from ..models import AuthorStats, Comment, Group, Post, TimelineEntry
+from .utils import run_on_commit
+
+User = get_user_model()
+
+CHANGELIST_URL = reverse('admin:posts_post_changelist')
+
+
+class PostAdminTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.reader.follower.create(author=cls.author)
+        cls.group = Group.objects.create(
+            title='Группа', slug='admin-group', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост номер {i}')
+            for i in range(3)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(PostAdminTest.admin)
+
+    def run_action(self, action, posts, **extra):
+        return self.client.post(CHANGELIST_URL, {
+            'action': action,
+            ACTION_CHECKBOX_NAME: [post.pk for post in posts],
+            **extra,
+        })
+
+    def test_changelist_and_search(self):
+        """Список постов открывается, поиск идёт по полнотекстовому индексу."""
+        response = self.client.get(CHANGELIST_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(CHANGELIST_URL, {'q': 'номер'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        response = self.client.get(CHANGELIST_URL, {'q': 'несуществующее'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_reassign_group(self):
+        """Действие переносит выбранные посты в группу одним UPDATE."""
+        posts = PostAdminTest.posts[:2]
+        self.run_action(
+            'reassign_group', posts, group=PostAdminTest.group.pk
+        )
+        self.assertEqual(
+            Post.objects.filter(group=PostAdminTest.group).count(), 2
+        )
+
+    def test_delete_posts(self):
+        """Удаление убирает посты, комментарии, записи лент и счётчики."""
+        posts = PostAdminTest.posts[:2]
+        before = versions(('post', posts[0].pk))
+        with run_on_commit():
+            self.run_action('delete_posts', posts)
+        self.assertNotEqual(versions(('post', posts[0].pk)), before)
+        self.assertFalse(Post.objects.filter(pk__in=[p.pk for p in posts]))
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=PostAdminTest.reader).count(),
+            1,
+        )
+        stats = AuthorStats.objects.get(user=PostAdminTest.author)
+        self.assertEqual(stats.posts_count, 1)
@@ -1,12 +1,18 @@
+import hashlib
+import os
 import shutil
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from posts.constants import POST_IMAGE_MAX_PIXELS
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post
 
@@ -31,6 +37,14 @@ class PostsFormsTest(TestCase):
             group=cls.group,
         )
         cls.form = PostForm()
+        cls.small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
 
     @classmethod
     def tearDownClass(cls):
@@ -76,7 +90,49 @@ class PostsFormsTest(TestCase):
             group=self.group.id,
         ).exists())
         post = Post.objects.latest('id')
-        self.assertEqual(post.image.name, 'posts/small.gif')
+        digest = hashlib.sha256(small_gif).hexdigest()
+        self.assertEqual(
+            post.image.name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        """Одинаковые картинки сохраняются в один файл."""
+        names = []
+        for name in ('first.gif', 'second.gif'):
+            uploaded = SimpleUploadedFile(
+                name=name, content=self.small_gif, content_type='image/gif'
+            )
+            self.authorized_client.post(reverse('posts:create'), data={
+                'text': name, 'image': uploaded,
+            })
+            names.append(Post.objects.get(text=name).image.name)
+        self.assertEqual(names[0], names[1])
+        directory = os.path.dirname(os.path.join(TEMP_MEDIA_ROOT, names[0]))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_identical_upload_refreshes_mtime(self):
+        """Повторная загрузка освежает mtime, и сборщик мусора её не тронет."""
+        storage = Post._meta.get_field('image').storage
+        name = storage.save('posts/old.gif', ContentFile(self.small_gif))
+        os.utime(storage.path(name), (0, 0))
+        storage.save('posts/again.gif', ContentFile(self.small_gif))
+        self.assertGreater(os.stat(storage.path(name)).st_mtime, 0)
+
+    def test_decompression_bomb_is_rejected(self):
+        """Картинка с огромным числом пикселей отклоняется формой."""
+        buffer = BytesIO()
+        side = int(POST_IMAGE_MAX_PIXELS ** 0.5) + 1
+        Image.new('1', (side, side)).save(buffer, 'PNG')
+        uploaded = SimpleUploadedFile(
+            name='bomb.png',
+            content=buffer.getvalue(),
+            content_type='image/png',
+        )
+        form = PostForm(
+            data={'text': 'Бомба'}, files={'image': uploaded}
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
 
     def test_posts_forms_edit_post(self):
         """Редактирование поста авторизированным пользователем."""
@@ -1,7 +1,11 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
 
-from ..models import Comment, Follow, Group, Post
+from ..models import AuthorStats, Comment, Follow, Group, Post
 
 User = get_user_model()
 
@@ -116,3 +120,121 @@ class FollowModelTest(TestCase):
             with self.subTest(value=value):
                 verbose_name = self.follow._meta.get_field(value).verbose_name
                 self.assertEqual(verbose_name, expected)
+
+    def test_follow_unique(self):
+        """Повторная подписка на того же автора не создаёт вторую строку."""
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(user=self.user_1, author=self.user_2)
+        follow, created = Follow.objects.get_or_create(
+            user=self.user_1, author=self.user_2
+        )
+        self.assertFalse(created)
+        self.assertEqual(follow, self.follow)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Post.objects.create(author=self.author, text='Ещё пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.author.stats.posts_count, 2)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).followers_count, 1
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.reader).following_count, 1
+        )
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(stats.posts_count, 2)
+
+    def test_recount_stats_command_repairs_counters(self):
+        """Команда recount_stats восстанавливает испорченные счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(
+            posts_count=99, followers_count=99, following_count=99
+        )
+        AuthorStats.objects.filter(user=self.reader).delete()
+        Post.objects.update(comments_count=99)
+        call_command('recount_stats', stdout=StringIO())
+        author_stats = AuthorStats.objects.get(user=self.author)
+        reader_stats = AuthorStats.objects.get(user=self.reader)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(author_stats.following_count, 0)
+        self.assertEqual(reader_stats.following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+
+def query_plan(queryset):
+    """Вывод EXPLAIN QUERY PLAN для запроса queryset одной строкой."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='plan-group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+
+    def assertPlanUses(self, queryset, index):
+        plan = query_plan(queryset)
+        self.assertIn(index, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_feed_plans_use_composite_indexes(self):
+        """Ленты группы и автора читаются по индексу без сортировки."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('план запроса проверяется только для SQLite')
+        feeds = {
+            'post_group_pub_date_idx': self.group.posts.select_related(
+                'author', 'group'
+            ),
+            'post_author_pub_date_idx': self.author.posts.select_related(
+                'author', 'group'
+            ),
+            'comment_post_created_idx': self.post.comments.select_related(
+                'author'
+            ),
+        }
+        for index, queryset in feeds.items():
+            with self.subTest(index=index):
+                self.assertPlanUses(queryset[:10], index)
+
+    def test_follow_lookup_uses_unique_index(self):
+        """Проверка подписки идёт по уникальному индексу (user, author)."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('план запроса проверяется только для SQLite')
+        queryset = self.author.following.filter(user=self.reader)
+        self.assertIn('INDEX sqlite_autoindex_posts_follow', query_plan(
+            queryset
+        ))
@@ -0,0 +1,316 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import sharding
+from ..models import (AuthorShard, AuthorStats, Comment, Follow, Group, Post,
+                      PostKey, TimelineEntry)
+from ..sharding import (_move_batch, across_shards, move_author, pin_author,
+                        rebalance, shard_for_post)
+from ..utils import encode_cursor
+from ..writes import writer
+
+User = get_user_model()
+
+SHARD = 'shard1'
+SHARDS = ['default', SHARD]
+
+
+@override_settings(SHARD_DATABASES=SHARDS)
+class ShardedTestCase(TestCase):
+    """Тесты с файловым шардом shard1 рядом с тестовой default."""
+
+    databases = {'default', SHARD}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        connections.databases[SHARD] = {
+            **settings.DATABASES['default'],
+            'NAME': os.path.join(cls.directory, 'shard1.sqlite3'),
+        }
+        with override_settings(SHARD_DATABASES=SHARDS):
+            call_command('migrate', database=SHARD, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[SHARD].close()
+        del connections[SHARD]
+        del connections.databases[SHARD]
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.near = User.objects.create_user(username='near')
+        self.far = User.objects.create_user(username='far')
+        pin_author(self.near.pk, 'default')
+        pin_author(self.far.pk, SHARD)
+        self.reader = User.objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def create_posts(self, count):
+        """Посты двух авторов через один, от новых к старым по id."""
+        now = timezone.now()
+        posts = []
+        for number in range(count):
+            author = (self.near, self.far)[number % 2]
+            post = Post.objects.create(author=author, text=f'Пост {number}')
+            pub_date = now - timedelta(minutes=count - number)
+            Post.objects.using(post._state.db).filter(pk=post.pk).update(
+                pub_date=pub_date
+            )
+            post.pub_date = pub_date
+            posts.append(post)
+        return posts[::-1]
+
+
+class ShardRoutingTests(ShardedTestCase):
+    def test_posts_land_on_author_shard(self):
+        """Посты лежат на шарде автора, id выдаёт общий каталог."""
+        near_post, far_post = self.create_posts(2)[::-1]
+        self.assertEqual(near_post._state.db, 'default')
+        self.assertEqual(far_post._state.db, SHARD)
+        self.assertFalse(Post.objects.using('default').filter(
+            author=self.far
+        ).exists())
+        self.assertEqual(
+            set(PostKey.objects.values_list('pk', flat=True)),
+            {near_post.pk, far_post.pk},
+        )
+
+    def test_feeds_merge_shards(self):
+        """Главная и подписки сливают шарды по дате, в том числе курсором."""
+        posts = self.create_posts(14)
+        Follow.objects.create(user=self.reader, author=self.near)
+        Follow.objects.create(user=self.reader, author=self.far)
+        for name in ('posts:index', 'posts:follow_index'):
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name))
+                page = response.context['page_obj']
+                self.assertEqual(list(page), posts[:10])
+                response = self.client.get(reverse(name), {'page': 2})
+                self.assertEqual(
+                    list(response.context['page_obj']), posts[10:]
+                )
+                response = self.client.get(
+                    reverse(name), {'cursor': encode_cursor(page[-1])}
+                )
+                self.assertEqual(
+                    list(response.context['page_obj']), posts[10:]
+                )
+
+    def test_offset_slices_match_full_merge(self):
+        """Срез со смещением совпадает со срезом полного слияния."""
+        posts = self.create_posts(14)
+        for number in range(5):
+            posts.insert(0, Post.objects.create(
+                author=self.near, text=f'Ещё {number}'
+            ))
+        merged = across_shards(Post.objects.all())
+        for start in range(len(posts)):
+            with self.subTest(start=start):
+                self.assertEqual(
+                    merged[start:start + 4], posts[start:start + 4]
+                )
+
+    def test_timeline_rows_follow_sharded_posts(self):
+        """С шардами лента не раскладывается, удаление чистит default."""
+        Follow.objects.create(user=self.reader, author=self.far)
+        post = Post.objects.create(author=self.far, text='Далёкий пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        TimelineEntry.objects.create(
+            user=self.reader,
+            post_id=post.pk,
+            author=self.far,
+            pub_date=post.pub_date,
+        )
+        post.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_post_page_and_comments_on_shard(self):
+        """Страница поста и комментарии читаются с шарда автора."""
+        post = Post.objects.create(author=self.far, text='Далёкий пост')
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Комментарий'},
+        )
+        comment = Comment.objects.using(SHARD).get()
+        self.assertEqual(comment.post_id, post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(response.context['post'], post)
+        self.assertEqual(list(response.context['comments']), [comment])
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'far'})
+        )
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+    def test_failed_comment_rolls_back_on_shard(self):
+        """Запись комментария откатывается на шарде, куда она писала."""
+        post = Post.objects.create(author=self.far, text='Далёкий пост')
+
+        def fail():
+            Comment.objects.using(SHARD).create(
+                post=post, author=self.reader, text='Откатится'
+            )
+            raise ValueError('ошибка')
+
+        with self.assertRaises(ValueError):
+            writer.submit(fail, using=SHARD)
+        self.assertFalse(Comment.objects.using(SHARD).exists())
+
+
+class RebalanceTests(ShardedTestCase):
+    def test_move_author_keeps_ids_and_dates(self):
+        """Перенос сохраняет id и даты постов и переносит комментарии."""
+        post = self.create_posts(2)[0]
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Ответ'
+        )
+        call_command(
+            'rebalance_shards', 'far', 'default', stdout=StringIO()
+        )
+        moved = Post.objects.using('default').get(pk=post.pk)
+        self.assertEqual(moved.pub_date, post.pub_date)
+        self.assertEqual(moved.comments_count, 1)
+        self.assertEqual(moved.comments.get().pk, comment.pk)
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.far).posts_count, 1
+        )
+        self.assertFalse(Post.objects.using(SHARD).exists())
+        self.assertFalse(Comment.objects.using(SHARD).exists())
+        self.assertEqual(
+            AuthorShard.objects.get(user=self.far).database, 'default'
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_move_is_repeatable(self):
+        """Посты, уже скопированные прерванным переносом, не дублируются."""
+        post = self.create_posts(2)[0]
+        Comment.objects.create(post=post, author=self.reader, text='Ответ')
+        _move_batch([post.pk], SHARD, 'default')
+        self.assertEqual(move_author(self.far.pk, 'default'), 1)
+        self.assertEqual(
+            Post.objects.using('default').filter(pk=post.pk).count(), 1
+        )
+        self.assertEqual(Comment.objects.using('default').count(), 1)
+        self.assertFalse(Post.objects.using(SHARD).exists())
+
+    def test_move_sweeps_posts_written_during_move(self):
+        """Пост, вставленный на исходный шард во время прохода, переносится."""
+        self.create_posts(2)
+        late = []
+        move_batch = sharding._move_batch
+
+        def insert_during_move(post_ids, source, target):
+            if not late:
+                late.append(Post.objects.using(source).create(
+                    author=self.far, text='Поздний пост'
+                ))
+            move_batch(post_ids, source, target)
+
+        with mock.patch.object(
+            sharding, '_move_batch', side_effect=insert_during_move
+        ):
+            self.assertEqual(move_author(self.far.pk, 'default'), 2)
+        self.assertFalse(Post.objects.using(SHARD).exists())
+        self.assertEqual(shard_for_post(late[0].pk), 'default')
+        self.assertTrue(
+            Post.objects.using('default').filter(pk=late[0].pk).exists()
+        )
+
+    def test_insert_after_move_follows_author(self):
+        """Вставка, выбравшая шард до переноса, досылается на новый шард."""
+        self.create_posts(2)
+        move_author(self.far.pk, 'default')
+        late = Post.objects.using(SHARD).create(
+            author=self.far, text='Поздний пост'
+        )
+        self.assertEqual(late._state.db, 'default')
+        self.assertFalse(Post.objects.using(SHARD).exists())
+        self.assertEqual(shard_for_post(late.pk), 'default')
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.far).posts_count, 2
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': late.pk})
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebalance_places_existing_posts(self):
+        """Без аргументов посты до шардов разносятся и попадают в каталог."""
+        with override_settings(SHARD_DATABASES=[]):
+            post = Post.objects.create(author=self.far, text='Старый пост')
+        self.assertEqual(post._state.db, 'default')
+        self.assertEqual(rebalance(), 1)
+        self.assertTrue(Post.objects.using(SHARD).filter(pk=post.pk).exists())
+        self.assertTrue(PostKey.objects.filter(pk=post.pk).exists())
+        newer = Post.objects.create(author=self.near, text='Новый пост')
+        self.assertGreater(newer.pk, post.pk)
+
+
+class ShardedAdminTests(ShardedTestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        self.client.force_login(admin)
+        self.url = reverse('admin:posts_post_changelist')
+        self.near_post, self.far_post = self.create_posts(2)[::-1]
+
+    def test_changelist_and_change_page_per_shard(self):
+        """Список показывает один шард, страница поста — его шард."""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.near_post]
+        )
+        response = self.client.get(self.url, {'shard': SHARD})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.far_post]
+        )
+        response = self.client.get(reverse(
+            'admin:posts_post_change', args=[self.far_post.pk]
+        ))
+        self.assertEqual(response.context['original'], self.far_post)
+
+    def test_actions_run_on_list_shard(self):
+        """Действия меняют и удаляют посты на шарде списка."""
+        group = Group.objects.create(title='Группа', slug='shard-group')
+        url = f'{self.url}?shard={SHARD}'
+        self.client.post(url, {
+            'action': 'reassign_group',
+            ACTION_CHECKBOX_NAME: [self.far_post.pk],
+            'group': group.pk,
+        })
+        self.assertEqual(
+            Post.objects.using(SHARD).get().group_id, group.pk
+        )
+        self.client.post(url, {
+            'action': 'delete_posts',
+            ACTION_CHECKBOX_NAME: [self.far_post.pk],
+        })
+        self.assertFalse(Post.objects.using(SHARD).exists())
+        self.assertTrue(Post.objects.using('default').exists())
@@ -1,12 +1,36 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from core.replicas import mark_synced
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from posts import orphans
+from posts.caching import REPLICA_FEED, bump, feed_key, versions
+from posts.models import (AuthorStats, Comment, Follow, Group, Post,
+                          TimelineEntry)
+from posts.thumbnails import generate, ready_thumbnail
+from posts.timeline import timeline_posts
+from posts.utils import CachedCountPaginator
+
+from .utils import run_on_commit
 
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 class PostsViewsTests(TestCase):
@@ -147,15 +171,131 @@ class PostsViewsTests(TestCase):
             author=self.user)
         content_add = self.authorized_client.get(
             reverse('posts:index')).content
-        post.delete()
-        content_delete = self.authorized_client.get(
+        # update() не шлёт сигналов: лента остаётся в кеше.
+        Post.objects.filter(pk=post.pk).update(text='Изменён в обход')
+        content_cached = self.authorized_client.get(
             reverse('posts:index')).content
-        self.assertEqual(content_add, content_delete)
+        self.assertEqual(content_add, content_cached)
         cache.clear()
         content_cache_clear = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertNotEqual(content_add, content_cache_clear)
 
+    def test_cache_invalidated_by_post_changes(self):
+        """Создание и удаление поста сразу видны во всех его лентах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        with run_on_commit():
+            post = Post.objects.create(
+                text='Свежий пост', author=self.user, group=self.group
+            )
+        for url in urls:
+            with self.subTest(url=url):
+                content = self.authorized_client.get(url).content.decode()
+                self.assertIn(post.text, content)
+        with run_on_commit():
+            post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                content = self.authorized_client.get(url).content.decode()
+                self.assertNotIn(post.text, content)
+
+    def test_cache_invalidated_by_comment(self):
+        """Новый комментарий сразу виден на странице поста."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.authorized_client.get(url)
+        with run_on_commit():
+            self.authorized_client.post(
+                reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+                data={'text': 'Свежий комментарий'},
+            )
+        self.assertIn(
+            'Свежий комментарий',
+            self.authorized_client.get(url).content.decode()
+        )
+
+    def test_cached_feed_keeps_header_per_user(self):
+        """Кеш ленты общий, а шапка рендерится для каждого запроса."""
+        header = f'Пользователь: {self.user.username}'
+        guest_content = Client().get(reverse('posts:index')).content.decode()
+        self.assertNotIn(header, guest_content)
+        user_content = self.authorized_client.get(
+            reverse('posts:index')
+        ).content.decode()
+        self.assertIn(header, user_content)
+        self.assertIn(self.post.text, user_content)
+        guest_content = Client().get(reverse('posts:index')).content.decode()
+        self.assertNotIn(header, guest_content)
+
+    def test_post_cards_shared_between_feeds(self):
+        """Карточка из кеша одной ленты используется и в другой."""
+        self.authorized_client.get(reverse('posts:index'))
+        with mock.patch(
+            'posts.cards.render_to_string', wraps=render_to_string
+        ) as render:
+            response = self.authorized_client.get(
+                reverse('posts:group_list', kwargs={'slug': self.group.slug})
+            )
+        render.assert_not_called()
+        self.assertIn(self.post.text, response.content.decode())
+
+    def test_post_card_follows_edits(self):
+        """Правка поста меняет ключ его карточки во всех лентах."""
+        self.authorized_client.get(reverse('posts:index'))
+        with run_on_commit():
+            self.authorized_client.post(
+                reverse('posts:edit', kwargs={'post_id': self.post.id}),
+                data={'text': 'Исправленный текст', 'group': self.group.pk},
+            )
+        content = self.authorized_client.get(
+            reverse('posts:index')
+        ).content.decode()
+        self.assertIn('Исправленный текст', content)
+
+    def test_post_card_follows_author_and_group(self):
+        """Правка имени автора или адреса группы видна в лентах сразу."""
+        self.authorized_client.get(reverse('posts:index'))
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Новое'
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed_slug'
+        with run_on_commit():
+            author.save()
+            group.save()
+        content = self.authorized_client.get(
+            reverse('posts:index')
+        ).content.decode()
+        self.assertIn('Новое', content)
+        self.assertIn('/group/renamed_slug/', content)
+
+
+class CommitOrderTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='writer')
+
+    def test_feeds_bumped_after_commit(self):
+        """
+        Поколение ленты меняется только после COMMIT: страница,
+        прочитанная внутри транзакции, не остаётся в кеше свежей.
+        """
+        url = reverse('posts:index')
+        self.client.get(url)
+        before = versions(('index',))
+        with transaction.atomic():
+            Post.objects.create(author=self.user, text='Свежий пост')
+            self.client.get(url)
+            self.assertEqual(versions(('index',)), before)
+        self.assertNotEqual(versions(('index',)), before)
+        self.assertIn(
+            'Свежий пост', self.client.get(url).content.decode()
+        )
+
 
 class PostsPaginatorViewsTests(TestCase):
     @classmethod
@@ -185,6 +325,297 @@ class PostsPaginatorViewsTests(TestCase):
         )
         self.assertEqual(len(response.context.get('page_obj').object_list), 3)
 
+    def test_count_cached_between_requests(self):
+        """Повторный запрос ленты не выполняет COUNT(*)."""
+        self.authorized_client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:index') + '?page=2')
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries)
+        )
+
+    @mock.patch('posts.utils._count_refresher')
+    def test_stale_count_used_as_estimate(self, refresher):
+        """После смены поколения старое число — оценка до пересчёта."""
+        key = feed_key('index')
+        cache.set('posts:count:index', ('index:old', 3))
+        paginator = CachedCountPaginator(Post.objects.all(), 10, key)
+        self.assertEqual(paginator.count, 3)
+        self.assertTrue(paginator.count_is_estimate)
+        refresher.submit.assert_called_once()
+        self.assertEqual(len(paginator.get_page(1)), 10)
+        self.assertEqual(len(paginator.get_page(2)), 3)
+
+    def test_page_window(self):
+        """Ссылки только на страницы вокруг текущей."""
+        paginator = CachedCountPaginator(list(range(1000)), 10)
+        self.assertEqual(list(paginator.page_window(50)), list(range(47, 54)))
+        self.assertEqual(list(paginator.page_window(1)), [1, 2, 3, 4])
+        self.assertEqual(
+            list(paginator.page_window(100)), [97, 98, 99, 100]
+        )
+
+
+class PostsCursorPaginatorViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Anthony')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый текст поста {count}', author=cls.user)
+            for count in range(13)
+        )
+        # Одинаковая дата у всех постов: порядок решает id.
+        Post.objects.update(pub_date=Post.objects.first().pub_date)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_pages_cover_feed(self):
+        """Курсоры проходят ленту вперёд и назад без пропусков."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(
+            url + '?cursor='
+        ).context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertFalse(first.has_previous())
+        second = self.authorized_client.get(
+            url + f'?cursor={first.next_cursor}'
+        ).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        ids = [post.id for post in list(first) + list(second)]
+        self.assertEqual(
+            ids,
+            list(Post.objects.order_by('-pub_date', '-id')
+                 .values_list('id', flat=True))
+        )
+        back = self.authorized_client.get(
+            url + f'?cursor={second.previous_cursor}'
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор отдаёт первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?cursor=broken'
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class PostsQueryCountTests(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+
+    # Сессия и пользователь — два запроса в каждом потолке. Группа,
+    # профиль и пост тратят ещё один запрос по индексу на ETag.
+    MAX_QUERIES = {
+        'posts:index': 4,
+        'posts:group_list': 6,
+        'posts:profile': 7,
+        'posts:follow_index': 5,
+        'posts:post_detail': 5,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        for number in range(10):
+            author = User.objects.create_user(username=f'author{number}')
+            Follow.objects.create(user=cls.reader, author=author)
+            cls.post = Post.objects.create(
+                author=author, text=f'Пост {number}', group=cls.group
+            )
+            Comment.objects.create(
+                post=cls.post, author=author, text=f'Комментарий {number}'
+            )
+        for number in range(10):
+            Comment.objects.create(
+                post=cls.post,
+                author=User.objects.get(username=f'author{number}'),
+                text=f'Ещё комментарий {number}',
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def assertMaxQueries(self, limit, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), limit,
+            '\n'.join(query['sql'] for query in queries)
+        )
+
+    def test_views_query_ceiling(self):
+        """Страницы укладываются в потолок запросов."""
+        kwargs = {
+            'posts:index': {},
+            'posts:group_list': {'slug': self.group.slug},
+            'posts:profile': {'username': self.post.author.username},
+            'posts:follow_index': {},
+            'posts:post_detail': {'post_id': self.post.id},
+        }
+        for name, limit in self.MAX_QUERIES.items():
+            with self.subTest(view=name):
+                url = reverse(name, kwargs=kwargs[name])
+                self.assertMaxQueries(limit, url)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='writer')
+        cls.reader = User.objects.create_user(username='watcher')
+        cls.group = Group.objects.create(
+            title='Группа', slug='conditional', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'writer'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ]
+
+    def test_unchanged_pages_are_not_rendered(self):
+        """Неизменённая страница отдаёт 304 без выборки постов."""
+        # Первая форма на странице поста ставит CSRF-куку, а она входит
+        # в ETag, поэтому считаем ETag со второго ответа.
+        for url in self.urls:
+            self.client.get(url)
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(any(
+                    'posts_post"."text' in query['sql']
+                    for query in queries
+                ))
+
+    def test_changes_refresh_etag(self):
+        """Новый пост, комментарий или подписка меняют ETag."""
+        changes = {
+            self.urls[0]: lambda: Post.objects.create(
+                author=self.author, text='Новый'
+            ),
+            self.urls[1]: lambda: Post.objects.create(
+                author=self.author, text='В группе', group=self.group
+            ),
+            self.urls[2]: lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ),
+            self.urls[3]: lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Ответ'
+            ),
+        }
+        for url, change in changes.items():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with run_on_commit():
+                    change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Другой пользователь получает свою страницу, а не 304."""
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_replica_sync_refreshes_replica_pages(self):
+        """Страница, прочитанная с копии, устаревает после синхронизации."""
+        url = self.urls[0]
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        bump(REPLICA_FEED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Копией служит сама default: важен только маршрут чтения.
+        mark_synced('default', time.time())
+        with self.settings(REPLICA_DATABASES=['default']):
+            etag = self.client.get(url)['ETag']
+            bump(REPLICA_FEED)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class SearchViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Anthony')
+        for count in range(12):
+            Post.objects.create(
+                text=f'Пост {count} про котиков', author=cls.user
+            )
+        cls.post = Post.objects.create(
+            text='<b>Собаки</b> лучше котиков, котиков, котиков',
+            author=cls.user,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        return self.client.get(reverse('posts:search'), params)
+
+    def test_search_ranks_and_highlights(self):
+        """Поиск ранжирует выдачу и подсвечивает слова запроса."""
+        response = self.search(q='котиков')
+        posts = response.context['posts']
+        self.assertEqual(len(posts), 10)
+        self.assertEqual(posts[0], self.post)
+        content = response.content.decode()
+        self.assertIn('<mark>котиков</mark>', content)
+        self.assertIn('&lt;b&gt;Собаки&lt;/b&gt;', content)
+
+    def test_search_keyset_pagination(self):
+        """Курсор отдаёт оставшиеся результаты без повторов."""
+        first = self.search(q='котиков').context
+        second = self.search(
+            q='котиков', cursor=first['next_cursor']
+        ).context
+        self.assertEqual(len(second['posts']), 3)
+        self.assertIsNone(second['next_cursor'])
+        self.assertFalse(set(first['posts']) & set(second['posts']))
+
+    def test_search_index_follows_updates(self):
+        """Индекс поиска следует за изменениями текста и удалением."""
+        Post.objects.filter(pk=self.post.pk).update(text='Только собаки')
+        self.assertEqual(list(self.search(q='собаки').context['posts']),
+                         [self.post])
+        cache.clear()
+        Post.objects.get(pk=self.post.pk).delete()
+        self.assertEqual(list(self.search(q='собаки').context['posts']), [])
+
+    def test_empty_query(self):
+        """Пустой запрос ничего не ищет."""
+        response = self.search(q='  "*  ')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'], [])
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -262,3 +693,289 @@ class FollowViewsTest(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotIn(post, response.context['page_obj'].object_list)
+
+    def test_follow_backfills_and_unfollow_prunes_timeline(self):
+        """Подписка заполняет ленту, отписка её очищает."""
+        follow = Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_author
+        )
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.post_follower, post=self.post
+            ).exists()
+        )
+        new_post = Post.objects.create(
+            author=self.post_author,
+            text='Новый пост'
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.post_follower).count(), 2
+        )
+        new_post.delete()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.post_follower).count(), 1
+        )
+        follow.delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.post_follower).exists()
+        )
+
+    def test_follow_feed_invalidated_by_follow(self):
+        """Подписка сразу меняет закешированную ленту подписок."""
+        url = reverse('posts:follow_index')
+        self.assertNotIn(
+            self.post.text, self.follower_client.get(url).content.decode()
+        )
+        with run_on_commit():
+            Follow.objects.create(
+                user=self.post_follower,
+                author=self.post_author
+            )
+        self.assertIn(
+            self.post.text, self.follower_client.get(url).content.decode()
+        )
+
+    @mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 0)
+    def test_heavy_author_posts_merged_on_read(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_author
+        )
+        post = Post.objects.create(
+            author=self.post_author,
+            text='Пост популярного автора'
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'].object_list)
+        self.assertIn(self.post, response.context['page_obj'].object_list)
+
+    def test_timeline_feed_surface(self):
+        """Лента из записей ведёт себя как выборка постов."""
+        group = Group.objects.create(title='Группа', slug='feed-group')
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_author
+        )
+        later = Post.objects.create(
+            author=self.post_author, text='Позже', group=group
+        )
+        feed = timeline_posts(self.post_follower).select_related('author')
+        self.assertEqual(list(feed), [later, self.post])
+        self.assertEqual(feed.count(), 2)
+        self.assertTrue(feed.exists())
+        self.assertEqual(feed[1:], [self.post])
+        self.assertEqual(feed[0], later)
+        self.assertEqual(list(feed.filter(group=group)), [later])
+        self.assertEqual(list(feed.filter(text='Позже')), [later])
+        self.assertEqual(list(feed.exclude(pk=later.pk)), [self.post])
+        self.assertEqual(
+            list(feed.filter(Q(pk=later.pk) | Q(group__isnull=True))),
+            [later, self.post],
+        )
+        self.assertEqual(
+            list(feed.order_by('pub_date', 'id')), [self.post, later]
+        )
+        with self.assertRaises(AttributeError):
+            feed.values('pk')
+
+
+class TimelineRefillTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='popular')
+        self.followers = [
+            User.objects.create_user(username=f'follower{number}')
+            for number in range(3)
+        ]
+        self.follows = [
+            Follow.objects.create(user=user, author=self.author)
+            for user in self.followers
+        ]
+
+    @mock.patch('posts.timeline.TIMELINE_REFILL_LIMIT', 1)
+    @mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 2)
+    def test_author_refilled_only_well_under_limit(self):
+        """
+        Автор с лишним подписчиком перестаёт раскладываться, а обратно
+        возвращается только ниже TIMELINE_REFILL_LIMIT, с перекладкой.
+        """
+        Follow.objects.create(
+            user=User.objects.create_user(username='extra'),
+            author=self.author,
+        )
+        post = Post.objects.create(author=self.author, text='Пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.follows[2].delete()
+        self.follows[1].delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+        Follow.objects.filter(user__username='extra').delete()
+        self.assertFalse(AuthorStats.objects.get(user=self.author).heavy)
+        self.assertEqual(
+            list(TimelineEntry.objects.values_list('user_id', 'post_id')),
+            [(self.followers[0].pk, post.pk)],
+        )
+        client = Client()
+        client.force_login(self.followers[0])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='painter')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=small_gif, content_type='image/gif'
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, лента отдаёт заглушку, потом — картинку."""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        self.assertContains(response, 'aspect-ratio')
+        thumbnail = generate(self.post.pk)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'aspect-ratio')
+        self.assertContains(response, thumbnail.url)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '480w')
+        self.assertTrue(thumbnail.url.endswith('.jpg'))
+
+    def test_page_thumbnails_are_fetched_in_one_query(self):
+        """Миниатюры страницы читаются из хранилища sorl одним запросом."""
+        for number in range(3):
+            post = Post.objects.create(
+                author=self.user, text=f'Ещё пост {number}',
+                image=self.post.image.name,
+            )
+            generate(post.pk)
+        generate(self.post.pk)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        kvstore_queries = [
+            query for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertNotContains(response, 'aspect-ratio')
+
+    def test_warm_thumbnails_command(self):
+        """Команда строит миниатюры для всех постов с картинками."""
+        out = StringIO()
+        call_command('warm_thumbnails', workers=1, stdout=out)
+        self.assertIn('1', out.getvalue())
+        self.assertIsNotNone(ready_thumbnail(self.post))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='collector')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.kept, cls.deleted = [
+            Post.objects.create(
+                author=cls.user,
+                text=name,
+                image=SimpleUploadedFile(
+                    name=f'{name}.gif',
+                    content=small_gif.replace(b'\xFF', color),
+                    content_type='image/gif',
+                ),
+            )
+            for name, color in (('kept', b'\xFF'), ('deleted', b'\x10'))
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.kept_thumbnail = generate(self.kept.pk)
+        self.deleted_thumbnail = generate(self.deleted.pk)
+        self.stale = os.path.join(TEMP_MEDIA_ROOT, 'cache', 'zz', 'old.jpg')
+        os.makedirs(os.path.dirname(self.stale), exist_ok=True)
+        open(self.stale, 'wb').close()
+        Post.objects.filter(pk=self.deleted.pk).delete()
+
+    def media_path(self, name):
+        return os.path.join(TEMP_MEDIA_ROOT, name)
+
+    def test_dry_run_only_reports(self):
+        """Пробный прогон находит сирот, но ничего не удаляет."""
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', dry_run=True, min_age=0, stdout=out
+        )
+        self.assertIn('Будет удалено картинок: 1', out.getvalue())
+        self.assertIn('миниатюр: 5', out.getvalue())
+        self.assertTrue(os.path.exists(self.stale))
+
+    def test_orphans_are_removed(self):
+        """Сироты удаляются, файлы живых постов остаются."""
+        call_command('collect_media_garbage', min_age=0, stdout=StringIO())
+        self.assertFalse(os.path.exists(self.stale))
+        deleted_files = (
+            self.deleted.image.name, self.deleted_thumbnail.fallback.name
+        )
+        for name in deleted_files:
+            self.assertFalse(os.path.exists(self.media_path(name)))
+        self.assertTrue(os.path.exists(self.media_path(self.kept.image.name)))
+        self.assertTrue(
+            os.path.exists(self.media_path(self.kept_thumbnail.fallback.name))
+        )
+        self.assertIsNotNone(ready_thumbnail(self.kept))
+
+    def test_file_reused_during_collection_is_kept(self):
+        """Картинка, снова понадобившаяся до удаления, остаётся на месте."""
+        take = orphans._take
+
+        def reuse_then_take(files, oldest):
+            Post.objects.create(
+                author=self.user, text='Снова', image=self.deleted.image.name
+            )
+            return take(files, oldest)
+
+        with mock.patch('posts.orphans._take', reuse_then_take):
+            call_command(
+                'collect_media_garbage', min_age=0, stdout=StringIO()
+            )
+        self.assertTrue(
+            os.path.exists(self.media_path(self.deleted.image.name))
+        )
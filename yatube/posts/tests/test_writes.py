@@ -0,0 +1,138 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, TransactionTestCase
+from django.urls import reverse
+
+from ..models import AuthorStats, Comment, Follow, Post
+from ..writes import WriteQueue, WriteTimeout, add_comment, writer
+
+User = get_user_model()
+
+
+class WriteQueueTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(author=self.author, text='Пост')
+        self.queue = WriteQueue(batch_size=10, batch_delay=0.2)
+        patcher = mock.patch.object(self.queue, 'inline', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_writes_land_in_batches(self):
+        """Одновременные записи фиксируются пачками и видны сразу."""
+        with mock.patch.object(
+            self.queue, '_commit', wraps=self.queue._commit
+        ) as commit, ThreadPoolExecutor(10) as pool:
+            comments = list(pool.map(
+                lambda i: self.queue.submit(
+                    add_comment, self.post.pk, self.author.pk, f'Текст {i}'
+                ),
+                range(10),
+            ))
+        self.assertEqual(len({comment.pk for comment in comments}), 10)
+        self.assertLess(commit.call_count, 10)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 10)
+
+    def test_failed_write_does_not_break_batch(self):
+        """Ошибка одной записи откатывает только её."""
+        def fail():
+            Comment.objects.create(
+                post=self.post, author=self.author, text='Откатится'
+            )
+            raise ValueError('ошибка')
+
+        failed = self.queue.enqueue(fail)
+        saved = self.queue.enqueue(
+            add_comment, self.post.pk, self.author.pk, 'Сохранится'
+        )
+        with self.assertRaises(ValueError):
+            failed.result(5)
+        self.assertEqual(saved.result(5).text, 'Сохранится')
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['Сохранится'],
+        )
+
+    def test_timeout_cancels_queued_write(self):
+        """По таймауту запись из очереди отменяется, начатая — неизвестна."""
+        self.queue.batch_delay = 0
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        with mock.patch('posts.writes.WRITE_TIMEOUT', 0.1), \
+                ThreadPoolExecutor(1) as pool:
+            running = pool.submit(self.queue.submit, slow)
+            started.wait(5)
+            with self.assertRaises(WriteTimeout) as queued:
+                self.queue.submit(
+                    add_comment, self.post.pk, self.author.pk, 'Отменена'
+                )
+            with self.assertRaises(WriteTimeout) as slow_error:
+                running.result(5)
+            release.set()
+        self.assertFalse(queued.exception.ambiguous)
+        self.assertTrue(slow_error.exception.ambiguous)
+        self.queue.submit(
+            add_comment, self.post.pk, self.author.pk, 'Следующая'
+        )
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)),
+            ['Следующая'],
+        )
+
+
+class QueuedViewsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(QueuedViewsTests.user)
+
+    def test_views_write_through_queue(self):
+        """Подписка и отписка идут через очередь записей."""
+        with mock.patch.object(
+            writer, 'submit', wraps=writer.submit
+        ) as submit:
+            self.client.get(reverse(
+                'posts:profile_follow', kwargs={'username': 'writer'}
+            ))
+            self.assertTrue(Follow.objects.filter(user=self.user).exists())
+            self.client.get(reverse(
+                'posts:profile_unfollow', kwargs={'username': 'writer'}
+            ))
+        self.assertEqual(submit.call_count, 2)
+        self.assertFalse(Follow.objects.filter(user=self.user).exists())
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_timeout_answers_503(self):
+        """Не дождавшаяся писателя подписка отвечает 503."""
+        with mock.patch.object(
+            writer, 'submit', side_effect=WriteTimeout(ambiguous=True)
+        ):
+            response = self.client.get(reverse(
+                'posts:profile_follow', kwargs={'username': 'writer'}
+            ))
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(response.context['ambiguous'])
+
+    def test_unfollow_without_follow(self):
+        """Отписка от автора, на которого не подписан, даёт 404."""
+        response = self.client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'writer'}
+        ))
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,238 @@
+"""
+Миниатюры картинок постов.
+
+Миниатюры готовятся в фоновом пуле сразу после сохранения поста,
+а шаблон лишь спрашивает хранилище ключей sorl, готовы ли они, и до тех
+пор показывает заглушку. Декодирование и ресайз не попадают в запрос.
+
+Для каждой картинки строится несколько ширин в каждом формате из
+POST_THUMBNAIL_FORMATS, который умеет сохранять Pillow; последний формат
+списка служит запасным для img.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from core.images import can_save
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+
+from . import timeline
+from .caching import bump, post_feeds
+from .constants import (POST_THUMBNAIL_FORMATS, POST_THUMBNAIL_OPTIONS,
+                        POST_THUMBNAIL_QUALITY, POST_THUMBNAIL_SIZE,
+                        POST_THUMBNAIL_SIZES, POST_THUMBNAIL_WIDTHS,
+                        THUMBNAIL_WORKERS)
+from .models import Post
+from .sharding import shard_for_post
+
+THUMBNAIL_LOCK_TIMEOUT = 60 * 5
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+
+_thumbnailer = ThreadPoolExecutor(
+    max_workers=THUMBNAIL_WORKERS, thread_name_prefix='posts-thumbnail'
+)
+
+
+def formats():
+    """Форматы миниатюр, которые умеет сохранять установленный Pillow."""
+    return [
+        format_ for format_ in POST_THUMBNAIL_FORMATS if can_save(format_)
+    ]
+
+
+def variants():
+    """Пары (формат, ширина) всех миниатюр одной картинки."""
+    return [
+        (format_, width)
+        for format_ in formats()
+        for width in POST_THUMBNAIL_WIDTHS
+    ]
+
+
+def _geometry(width):
+    base_width, base_height = POST_THUMBNAIL_SIZE
+    return f'{width}x{round(width * base_height / base_width)}'
+
+
+def _options(format_):
+    return {
+        **POST_THUMBNAIL_OPTIONS,
+        'format': format_,
+        'quality': POST_THUMBNAIL_QUALITY[format_],
+    }
+
+
+class PostThumbnail:
+    """Готовые варианты миниатюры одной картинки для тега picture."""
+
+    sizes = POST_THUMBNAIL_SIZES
+
+    def __init__(self, files):
+        self.files = files
+        fallback = formats()[-1]
+        self.fallback = files[fallback, max(POST_THUMBNAIL_WIDTHS)]
+        self.srcset = self._srcset(fallback)
+
+    def _srcset(self, format_):
+        return ', '.join(
+            f'{self.files[format_, width].url} {width}w'
+            for width in POST_THUMBNAIL_WIDTHS
+        )
+
+    @property
+    def url(self):
+        return self.fallback.url
+
+    @property
+    def width(self):
+        return self.fallback.width
+
+    @property
+    def height(self):
+        return self.fallback.height
+
+    @property
+    def sources(self):
+        return [
+            {'type': MIME_TYPES[format_], 'srcset': self._srcset(format_)}
+            for format_ in formats()[:-1]
+        ]
+
+
+def _lock_key(post_id):
+    return f'posts:thumbnail:{post_id}:lock'
+
+
+def thumbnail_file(image, format_, width):
+    """Файл миниатюры с тем же именем, что построит sorl.get_thumbnail."""
+    backend = default.backend
+    source = ImageFile(image)
+    options = _options(format_)
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(
+        source, _geometry(width), options
+    )
+    return ImageFile(name, default.storage)
+
+
+def _fetch_raw(keys):
+    """Значения хранилища sorl одним get_many и одним запросом к базе."""
+    store = default.kvstore
+    found = store.cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        rows = dict(
+            KVStore.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        fetched = {key: rows.get(key, EMPTY_VALUE) for key in missing}
+        store.cache.set_many(
+            fetched, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        found.update(fetched)
+    return found
+
+
+def _lookup(files):
+    if not isinstance(default.kvstore, CachedDBStore):
+        return {
+            variant: default.kvstore.get(file)
+            for variant, file in files.items()
+        }
+    keys = {variant: add_prefix(file.key) for variant, file in files.items()}
+    raw = _fetch_raw(list(keys.values()))
+    return {
+        variant: deserialize_image_file(raw[key])
+        for variant, key in keys.items()
+        if raw.get(key) not in (None, EMPTY_VALUE)
+    }
+
+
+def ready_thumbnails(posts):
+    """
+    Готовые миниатюры постов страницы: {id поста: PostThumbnail}.
+
+    Вместо отдельного обращения к хранилищу sorl на каждый вариант
+    каждого поста ключи всей страницы читаются разом. Посты, у которых
+    готовы не все варианты, в словарь не попадают.
+    """
+    files = {
+        (post.pk, *variant): thumbnail_file(post.image, *variant)
+        for post in posts
+        if post.image
+        for variant in variants()
+    }
+    found = _lookup(files)
+    thumbnails = {}
+    for post in posts:
+        if not post.image:
+            continue
+        post_files = {
+            variant: found.get((post.pk, *variant)) for variant in variants()
+        }
+        if all(post_files.values()):
+            thumbnails[post.pk] = PostThumbnail(post_files)
+    return thumbnails
+
+
+def ready_thumbnail(post):
+    """Готовая миниатюра поста или None, если её ещё нет."""
+    return ready_thumbnails([post]).get(post.pk)
+
+
+def generate(post_id, bump_feeds=True):
+    """Строит все варианты миниатюры поста и сбрасывает ленты с заглушкой."""
+    post = Post.objects.using(shard_for_post(post_id)).filter(
+        pk=post_id
+    ).first()
+    if post is None or not post.image:
+        return None
+    thumbnail = PostThumbnail({
+        (format_, width): get_thumbnail(
+            post.image, _geometry(width), **_options(format_)
+        )
+        for format_, width in variants()
+    })
+    if bump_feeds:
+        followers = timeline.light_followers(post.author_id)
+        bump(*post_feeds(post, followers))
+    return thumbnail
+
+
+def _generate_in_background(post_id):
+    try:
+        generate(post_id)
+    finally:
+        cache.delete(_lock_key(post_id))
+        connections.close_all()
+
+
+def _submit(post_id):
+    if not settings.THUMBNAIL_ASYNC:
+        generate(post_id)
+        return
+    if cache.add(_lock_key(post_id), True, THUMBNAIL_LOCK_TIMEOUT):
+        _thumbnailer.submit(_generate_in_background, post_id)
+
+
+def schedule(post_id):
+    """Ставит миниатюру в очередь, когда пост уже зафиксирован в базе."""
+    transaction.on_commit(lambda: _submit(post_id))
@@ -0,0 +1,324 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max, Q
+
+from . import sharding
+from .constants import (TIMELINE_BATCH_SIZE, TIMELINE_FANOUT_LIMIT,
+                        TIMELINE_REFILL_LIMIT)
+from .models import AuthorStats, Follow, Post, TimelineEntry
+
+REFILL_LOCK_TIMEOUT = 60 * 30
+
+_refiller = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix='posts-timeline'
+)
+
+
+def heavy_authors(user):
+    """Авторы из подписок user, посты которых не раскладываются по лентам."""
+    return list(
+        Follow.objects.filter(
+            user=user, author__stats__heavy=True
+        ).values_list('author_id', flat=True)
+    )
+
+
+def is_heavy_author(author_id):
+    return AuthorStats.objects.filter(user_id=author_id, heavy=True).exists()
+
+
+def _bulk_create(entries):
+    entries = iter(entries)
+    batch = list(islice(entries, TIMELINE_BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, TIMELINE_BATCH_SIZE))
+
+
+def light_followers(author_id):
+    """Подписчики, в ленты которых раскладываются посты автора."""
+    if is_heavy_author(author_id):
+        return []
+    return list(
+        Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+    )
+
+
+def fan_out(post):
+    """
+    Кладёт новый пост в ленты подписчиков автора и возвращает их id.
+    С шардами лента собирается из постов (timeline_posts), и записи не
+    создаются: их никто не прочитает.
+    """
+    followers = light_followers(post.author_id)
+    if sharding.enabled():
+        return followers
+    _bulk_create(
+        TimelineEntry(
+            user_id=user_id,
+            post=post,
+            author_id=post.author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id in followers
+    )
+    return followers
+
+
+def backfill(follow):
+    """Переносит посты автора в ленту нового подписчика."""
+    if sharding.enabled() or is_heavy_author(follow.author_id):
+        return
+    posts = Post.objects.using(
+        sharding.shard_for_author(follow.author_id)
+    ).filter(author_id=follow.author_id).values_list('id', 'pub_date')
+    _bulk_create(
+        TimelineEntry(
+            user_id=follow.user_id,
+            post_id=post_id,
+            author_id=follow.author_id,
+            pub_date=pub_date,
+        )
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def followers_changed(author_id):
+    """
+    Переключает раскладку постов автора после подписки или отписки.
+
+    Автор становится «тяжёлым», когда подписчиков больше
+    TIMELINE_FANOUT_LIMIT, а «лёгким» — только когда их не больше
+    TIMELINE_REFILL_LIMIT. Иначе подписки и отписки у порога
+    перекладывали бы ленты каждый раз. Перекладка идёт после фиксации
+    записи, в фоне (refill).
+    """
+    stats = AuthorStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', 'heavy'
+    ).first()
+    if stats is None:
+        return
+    followers_count, heavy = stats
+    if not heavy and followers_count > TIMELINE_FANOUT_LIMIT:
+        AuthorStats.objects.filter(user_id=author_id).update(heavy=True)
+    elif heavy and followers_count <= TIMELINE_REFILL_LIMIT:
+        transaction.on_commit(lambda: _submit_refill(author_id))
+
+
+def _refill_lock_key(author_id):
+    return f'posts:timeline:refill:{author_id}:lock'
+
+
+def _refill_in_background(author_id):
+    try:
+        refill(author_id)
+    finally:
+        cache.delete(_refill_lock_key(author_id))
+        connections.close_all()
+
+
+def _submit_refill(author_id):
+    if not settings.TIMELINE_REFILL_ASYNC:
+        refill(author_id)
+        return
+    if cache.add(_refill_lock_key(author_id), True, REFILL_LOCK_TIMEOUT):
+        _refiller.submit(_refill_in_background, author_id)
+
+
+def _fill(author_id, posts, follows):
+    """Записи лент для всех пар подписчик × пост, пачками."""
+    posts = list(posts.values_list('id', 'pub_date'))
+    if not posts:
+        return
+    _bulk_create(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for user_id in follows.values_list('user_id', flat=True).iterator()
+        for post_id, pub_date in posts
+    )
+
+
+def refill(author_id):
+    """
+    Раскладывает посты «тяжёлого» автора по лентам подписчиков и снимает
+    с него отметку.
+
+    Пока отметка стояла, новые посты в ленты не попадали, а новые
+    подписчики не получали прежних. Каждая пачка TIMELINE_BATCH_SIZE
+    вставляется своей транзакцией, так что блокировка записи SQLite не
+    держится на всю перекладку. Посты и подписки, появившиеся, пока она
+    шла, докладываются после снятия отметки.
+    """
+    stats = AuthorStats.objects.filter(
+        user_id=author_id,
+        heavy=True,
+        followers_count__lte=TIMELINE_REFILL_LIMIT,
+    )
+    if not stats.exists():
+        return
+    if sharding.enabled():
+        stats.update(heavy=False)
+        return
+    posts = Post.objects.using(
+        sharding.shard_for_author(author_id)
+    ).filter(author_id=author_id).order_by()
+    follows = Follow.objects.filter(author_id=author_id).order_by()
+    last_post = posts.aggregate(last=Max('pk'))['last'] or 0
+    last_follow = follows.aggregate(last=Max('pk'))['last'] or 0
+    earlier_posts = posts.filter(pk__lte=last_post)
+    _fill(author_id, earlier_posts, follows.filter(pk__lte=last_follow))
+    stats.update(heavy=False)
+    _fill(author_id, posts.filter(pk__gt=last_post), follows)
+    _fill(author_id, earlier_posts, follows.filter(pk__gt=last_follow))
+
+
+def prune(follow):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, author_id=follow.author_id
+    ).delete()
+
+
+def forget(post, using):
+    """
+    Убирает удалённый пост из лент. Записи лент лежат в default, и
+    каскад удаления с другого шарда их не видит.
+    """
+    if using != DEFAULT_DB_ALIAS:
+        TimelineEntry.objects.filter(post_id=post.pk).delete()
+
+
+def _entry_lookup(lookup):
+    """Поле поста в фильтре или сортировке — поле записи ленты."""
+    descending = lookup.startswith('-')
+    field, _, rest = lookup.lstrip('-').partition('__')
+    if field in ('id', 'pk'):
+        field = 'post_id'
+    elif field not in ('pub_date', 'author', 'author_id'):
+        field = f'post__{field}'
+    return '-' * descending + '__'.join(filter(None, (field, rest)))
+
+
+def _entry_q(q):
+    clone = Q()
+    clone.connector, clone.negated = q.connector, q.negated
+    clone.children = [
+        _entry_q(child) if isinstance(child, Q)
+        else (_entry_lookup(child[0]), child[1])
+        for child in q.children
+    ]
+    return clone
+
+
+class TimelineFeed:
+    """
+    Лента подписок, которая читается из TimelineEntry и отдаёт посты.
+
+    Страница — один проход по индексу (user, -pub_date, -post) с постами
+    через select_related. Поддерживаются только методы ниже: filter,
+    exclude (с Q или без) и order_by по полям поста — id/pk, pub_date и
+    author переводятся на поля записи ленты, остальные идут через JOIN
+    на пост; select_related и prefetch_related от поста; count, exists,
+    перебор и срезы. Этого хватает пагинаторам и слиянию шардов; всё
+    остальное (values, annotate, update...) даёт AttributeError.
+    """
+
+    model = Post
+
+    def __init__(self, entries):
+        self.entries = entries
+
+    def __repr__(self):
+        return f'<TimelineFeed {self.entries.query}>'
+
+    def _chain(self, entries):
+        return TimelineFeed(entries)
+
+    def all(self):
+        return self._chain(self.entries.all())
+
+    def filter(self, *args, **kwargs):
+        return self._chain(self.entries.filter(
+            *[_entry_q(q) for q in args],
+            **{_entry_lookup(name): value for name, value in kwargs.items()}
+        ))
+
+    def exclude(self, *args, **kwargs):
+        return self._chain(self.entries.exclude(
+            *[_entry_q(q) for q in args],
+            **{_entry_lookup(name): value for name, value in kwargs.items()}
+        ))
+
+    def order_by(self, *fields):
+        return self._chain(
+            self.entries.order_by(*[_entry_lookup(name) for name in fields])
+        )
+
+    def select_related(self, *fields):
+        return self._chain(self.entries.select_related(
+            *[f'post__{name}' for name in fields]
+        ))
+
+    def prefetch_related(self, *lookups):
+        return self._chain(self.entries.prefetch_related(
+            *[f'post__{name}' for name in lookups]
+        ))
+
+    @property
+    def ordered(self):
+        return self.entries.ordered
+
+    def count(self):
+        return self.entries.count()
+
+    def exists(self):
+        return self.entries.exists()
+
+    def __iter__(self):
+        return (entry.post for entry in self.entries)
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            return [entry.post for entry in self.entries[k]]
+        return self.entries[k].post
+
+
+def timeline_posts(user, heavy=None):
+    """
+    Лента подписок: чтение материализованной ленты пользователя.
+
+    Посты авторов с большим числом подписчиков не раскладываются
+    при публикации и подмешиваются сюда при чтении слиянием по дате;
+    их записи, оставшиеся с тех пор, когда автор был «лёгким»,
+    пропускаются. С шардами лента сливается из постов всех авторов
+    подписки: материализованная лента лежит в default и не соединяется
+    с постами других баз.
+    """
+    if sharding.enabled():
+        return sharding.posts_by_authors(
+            Follow.objects.filter(user=user).values_list(
+                'author_id', flat=True
+            )
+        )
+    if heavy is None:
+        heavy = heavy_authors(user)
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post'
+    ).order_by('-pub_date', '-post_id')
+    if not heavy:
+        return TimelineFeed(entries)
+    # Слияние берёт порядок у первой выборки, поэтому посты — первыми.
+    return sharding.ShardedQuerySet([
+        Post.objects.filter(author_id__in=heavy),
+        TimelineFeed(entries.exclude(author_id__in=heavy)),
+    ])
@@ -1,9 +1,218 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 
-from .constants import POSTS_PER_PAGE
+from core.caching.coalescing import get_or_build
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
+from .constants import (COUNT_CACHE_TIMEOUT, COUNT_REFRESH_ASYNC, CURSOR_PARAM,
+                        PAGE_WINDOW, POSTS_PER_PAGE)
 
-def paginator_def(request, post_obj):
-    paginator = Paginator(post_obj, POSTS_PER_PAGE)
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def encode_cursor(post, direction=FORWARD):
+    raw = f'{direction}|{post.pub_date.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (направление, pub_date, id) или None для битого курсора."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, pub_date, pk = raw.split('|')
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if direction not in (FORWARD, BACKWARD) or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPage(Sequence):
+    """Страница ленты, которая ссылается на соседние по курсорам."""
+
+    is_cursor = True
+
+    def __init__(self, object_list, cursor, next_cursor, previous_cursor,
+                 paginator):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} items>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключу (pub_date, id) без COUNT(*) и OFFSET.
+
+    Любая страница читается одним запросом по индексу, поэтому
+    глубокие страницы стоят столько же, сколько первая.
+    """
+
+    def __init__(self, object_list, per_page):
+        self.object_list = object_list
+        self.per_page = per_page
+
+    def get_page(self, cursor):
+        decoded = decode_cursor(cursor) if cursor else None
+        queryset = self.object_list
+        if decoded is None:
+            direction = FORWARD
+            queryset = queryset.order_by('-pub_date', '-id')
+        else:
+            direction, pub_date, pk = decoded
+            if direction == FORWARD:
+                queryset = queryset.filter(
+                    Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+                ).order_by('-pub_date', '-id')
+            else:
+                queryset = queryset.filter(
+                    Q(pub_date__gt=pub_date) | Q(pub_date=pub_date, id__gt=pk)
+                ).order_by('pub_date', 'id')
+        posts = list(queryset[:self.per_page + 1])
+        if direction == BACKWARD and not posts:
+            return self.get_page(None)
+        has_more = len(posts) > self.per_page
+        posts = posts[:self.per_page]
+        if direction == BACKWARD:
+            posts.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, decoded is not None
+        next_cursor = previous_cursor = None
+        if posts and has_next:
+            next_cursor = encode_cursor(posts[-1], FORWARD)
+        if posts and has_previous:
+            previous_cursor = encode_cursor(posts[0], BACKWARD)
+        return CursorPage(
+            posts, cursor, next_cursor, previous_cursor, self
+        )
+
+
+COUNT_REFRESH_LOCK_TIMEOUT = 60
+
+_count_refresher = ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix='posts-count'
+)
+
+
+def _count_cache_key(name):
+    return f'posts:count:{name}'
+
+
+def _refresh_count(queryset, key):
+    """Пересчитывает COUNT(*) ленты в фоне и кладёт его в кеш."""
+    lock_key = f'{_count_cache_key(key.name)}:lock'
+    if not cache.add(lock_key, True, COUNT_REFRESH_LOCK_TIMEOUT):
+        return
+    try:
+        count = queryset.count()
+        cache.set(
+            _count_cache_key(key.name), (str(key), count), COUNT_CACHE_TIMEOUT
+        )
+    finally:
+        cache.delete(lock_key)
+        connections.close_all()
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator с закешированным числом постов и окном номеров страниц.
+
+    Точное число хранится вместе с ключом ленты (posts.caching.feed_key)
+    и верно, пока у ленты не сменилось поколение. После смены прежнее
+    число отдаётся как оценка, а точное пересчитывается в фоне. Если
+    числа нет совсем, COUNT(*) считает один воркер (get_or_build), а
+    остальные ждут его. Страницы режутся по per_page, поэтому оценка
+    влияет только на ссылки.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.count_is_estimate = False
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return super().count
+        cache_key = _count_cache_key(self.count_key.name)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            key, count = cached
+            if key == self.count_key:
+                return count
+            if COUNT_REFRESH_ASYNC:
+                self.count_is_estimate = True
+                _count_refresher.submit(
+                    _refresh_count, self.object_list, self.count_key
+                )
+                return count
+        count = get_or_build(
+            f'{cache_key}:{self.count_key}',
+            lambda: super(CachedCountPaginator, self).count,
+            COUNT_CACHE_TIMEOUT,
+        )
+        cache.set(cache_key, (str(self.count_key), count), COUNT_CACHE_TIMEOUT)
+        return count
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.count_is_estimate and int(number) > 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+    def page_window(self, number, on_each_side=PAGE_WINDOW):
+        """Номера страниц вокруг текущей вместо всего page_range."""
+        first = max(number - on_each_side, 1)
+        last = min(number + on_each_side, max(self.num_pages, number))
+        return range(first, last + 1)
+
+
+def paginator_def(request, post_obj, count_key=None):
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor is not None:
+        return CursorPaginator(post_obj, POSTS_PER_PAGE).get_page(cursor)
+    paginator = CachedCountPaginator(post_obj, POSTS_PER_PAGE, count_key)
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    page = paginator.get_page(page_number)
+    page.page_window = paginator.page_window(page.number)
+    return page
@@ -1,63 +1,114 @@
+from core.replicas import pin_to_primary, read_from_replica
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 
+from . import conditional, writes
+from .caching import feed_key
+from .counters import stats_for
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Group, Post, User
+from .search import search_posts
+from .sharding import across_shards, related, shard_for_post
+from .timeline import heavy_authors, timeline_posts
 from .utils import paginator_def
 
 
-@cache_page(20)
+@read_from_replica
+@condition(etag_func=conditional.index_etag)
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = paginator_def(request, post_list)
+    post_list = across_shards(Post.objects.all()).select_related(
+        'author', 'group'
+    )
+    key = feed_key('index')
+    page_obj = paginator_def(request, post_list, key)
     return render(request,
                   'posts/index.html',
-                  {'page_obj': page_obj}
+                  {'page_obj': page_obj, 'feed_key': key}
                   )
 
 
+@read_from_replica
+@condition(etag_func=conditional.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = paginator_def(request, post_list)
+    post_list = across_shards(group.posts.all()).select_related(
+        'author', 'group'
+    )
+    key = feed_key('group', group.pk)
+    page_obj = paginator_def(request, post_list, key)
     return render(request,
                   'posts/group_list.html',
-                  {'group': group, 'page_obj': page_obj}
+                  {
+                      'group': group,
+                      'page_obj': page_obj,
+                      'feed_key': key,
+                  }
                   )
 
 
+@read_from_replica
+@condition(etag_func=conditional.profile_etag)
 def profile(request, username):
-    author = User.objects.get(username=username)
-    posts = author.posts.all()
-    page_obj = paginator_def(request, posts)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts = related(author.posts.all(), 'author', 'group')
+    key = feed_key('profile', author.pk)
+    page_obj = paginator_def(request, posts, key)
     following = request.user.is_authenticated
     if following:
         following = author.following.filter(user=request.user).exists()
     context = {
         'author': author,
+        'author_stats': stats_for(author),
         'page_obj': page_obj,
-        'posts': posts,
         'following': following,
+        'feed_key': key,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts, next_cursor = search_posts(query, request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'posts': posts,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@read_from_replica
+@condition(etag_func=conditional.post_etag)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = Post.objects.filter(author=post.author).count()
-    comments = post.comments.all()
+    post = get_object_or_404(
+        related(
+            Post.objects.using(shard_for_post(post_id)),
+            'author__stats',
+            'group',
+        ),
+        id=post_id,
+    )
+    posts_count = stats_for(post.author).posts_count
+    comments = related(post.comments.all(), 'author')
     form = CommentForm()
     context = {
         'post': post,
         'posts_count': posts_count,
         'comments': comments,
         'form': form,
+        'comments_key': feed_key('post', post.pk),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
 @login_required
+@pin_to_primary
+@transaction.atomic
 def post_create(request):
     form = PostForm(
         request.POST or None,
@@ -72,8 +123,11 @@ def post_create(request):
 
 
 @login_required
+@pin_to_primary
 def post_edit(request, post_id):
-    edit_post = get_object_or_404(Post, id=post_id)
+    edit_post = get_object_or_404(
+        Post.objects.using(shard_for_post(post_id)), id=post_id
+    )
     if request.user != edit_post.author:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
@@ -91,43 +145,63 @@ def post_edit(request, post_id):
 
 
 @login_required
+@pin_to_primary
+@writes.answer_timeouts
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    using = shard_for_post(post_id)
+    post = get_object_or_404(Post.objects.using(using), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        writes.writer.submit(
+            writes.add_comment,
+            post.pk,
+            request.user.pk,
+            form.cleaned_data['text'],
+            using=using,
+        )
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@read_from_replica
+@condition(etag_func=conditional.follow_etag)
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
+    heavy = getattr(request, 'heavy_authors', None)
+    if heavy is None:
+        heavy = heavy_authors(request.user)
+    posts = timeline_posts(request.user, heavy).select_related(
+        'author', 'group'
     )
-    page_obj = paginator_def(request, posts)
+    key = feed_key(
+        'follow',
+        request.user.pk,
+        depends_on=[('profile', author_id) for author_id in heavy],
+    )
+    page_obj = paginator_def(request, posts, key)
     return render(request,
                   'posts/follow.html',
-                  {'page_obj': page_obj}
+                  {
+                      'page_obj': page_obj,
+                      'feed_key': key,
+                  }
                   )
 
 
 @login_required
+@pin_to_primary
+@writes.answer_timeouts
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        writes.writer.submit(writes.follow, request.user.pk, author.pk)
     return redirect('posts:profile', author)
 
 
 @login_required
+@pin_to_primary
+@writes.answer_timeouts
 def profile_unfollow(request, username):
-    user_follower = get_object_or_404(
-        Follow,
-        user=request.user,
-        author__username=username
-    )
-    user_follower.delete()
+    author = get_object_or_404(User, username=username)
+    if not writes.writer.submit(writes.unfollow, request.user.pk, author.pk):
+        raise Http404('Подписка не найдена.')
     return redirect('posts:profile', username)
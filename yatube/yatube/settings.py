@@ -1,4 +1,5 @@
 import os
+import sys
 
 from dotenv import find_dotenv, load_dotenv
 
@@ -35,6 +36,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.TextGZipMiddleware',
+    'core.middleware.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -67,11 +70,56 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'TRANSACTION_MODE': 'IMMEDIATE',
+        # Выполняются на каждом новом соединении, см. core.db.
+        'PRAGMAS': {
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'busy_timeout': 5000,
+            'cache_size': -32000,
+            'mmap_size': 256 * 1024 * 1024,
+            'temp_store': 'memory',
+        },
     }
 }
 
+# Локальные копии default для чтения лент; их обновляет sync_replicas.
+REPLICA_DATABASES = []
+for number in range(1, int(os.environ.get('DB_REPLICAS', 0)) + 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, 'var', f'{alias}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+# Шарды постов и комментариев: default и ещё DB_SHARDS - 1 баз, см.
+# posts.sharding. Новые базы готовит migrate --database, а посты по ним
+# раскладывает rebalance_shards.
+SHARD_DATABASES = []
+for number in range(1, int(os.environ.get('DB_SHARDS', 1))):
+    alias = f'shard{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, 'var', f'{alias}.sqlite3'),
+    }
+    SHARD_DATABASES.append(alias)
+if SHARD_DATABASES:
+    SHARD_DATABASES.insert(0, 'default')
+
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.replicas.ReplicaRouter',
+]
+REPLICA_PIN_COOKIE = 'primary_written_at'
+# Копия, снимок которой старше этого числа секунд, не читается; запускайте
+# sync_replicas --interval заметно чаще, см. core.replicas.
+REPLICA_MAX_LAG = 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -100,6 +148,11 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATIC_ROOT = os.path.join(BASE_DIR, 'var', 'static')
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+
+# Ответы короче этого числа байт не сжимаются gzip.
+GZIP_MIN_LENGTH = 1024
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -112,13 +165,30 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# None, 'x-accel-redirect' (nginx) или 'x-sendfile' (Apache).
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Фоновые пулы в тестах работают сразу: их потоки пережили бы тестовую
+# базу и временный MEDIA_ROOT.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+TIMELINE_REFILL_ASYNC = not TESTING
+THUMBNAIL_ASYNC = not TESTING
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.caching.backends.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'var', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'L1_MAX_ENTRIES': 1000,
+        },
     }
 }
 
+THUMBNAIL_BACKEND = 'core.images.Backend'
+THUMBNAIL_ENGINE = 'core.images.Engine'
+
 if DEBUG:
     INTERNAL_IPS = ('127.0.0.1', )
 
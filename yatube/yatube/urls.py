@@ -13,10 +13,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
+from core.media import serve_media
+from core.staticfiles import serve_static
 from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 urlpatterns = [
     path('auth/', include('users.urls')),
@@ -24,6 +27,16 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('posts.urls', namespace='index')),
     path('about/', include('about.urls', namespace='about')),
+    re_path(
+        r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+        serve_media,
+        name='media',
+    ),
+    re_path(
+        r'^%s(?P<path>.+)$' % re.escape(settings.STATIC_URL.lstrip('/')),
+        serve_static,
+        name='static',
+    ),
 ]
 
 handler404 = 'core.views.page_not_found'
@@ -31,13 +44,9 @@ handler403 = 'core.views.permission_denied'
 handler500 = 'core.views.server_error'
 
 if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
+    import mimetypes
 
-if settings.DEBUG:
     import debug_toolbar
-    import mimetypes
 
     mimetypes.add_type("application/javascript", ".js", True)
     